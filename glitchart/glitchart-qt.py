@@ -7,10 +7,10 @@ import os
 from PySide6.QtWidgets import QMainWindow, QFileDialog, QApplication, QPushButton, QLabel, QWidget, QVBoxLayout, QHBoxLayout, QLineEdit, QComboBox, QCheckBox, QGridLayout, QSpinBox, QDoubleSpinBox, QSlider, QFormLayout, QSizePolicy, QSpacerItem, QTabWidget, QFrame, QScrollArea
 from PySide6.QtGui import QPixmap, QImage, QPalette, QIcon
 from PySide6 import QtCore
-from PySide6.QtCore import QSize, Qt, QPointF
+from PySide6.QtCore import QSize, Qt, QPointF, QObject, QRunnable, QThreadPool, Signal
 
-from PIL.ImageQt import ImageQt
 from PIL import Image
+import numpy as np
 
 import util
 import pixelsort
@@ -131,6 +131,41 @@ class DiagonalArgs(GlitchFunctionArgs):
         return kwargs
 
 
+class TileArgs(GlitchFunctionArgs):
+    """ Tile Group Parameters:
+            Tile Width: integer
+            Tile Height: integer
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.initUI()
+
+    def initUI(self):
+        self.layout = QFormLayout(self)
+        self.tile_width_input = QSpinBox()
+        self.tile_width_input.setSuffix("px")
+        self.tile_width_input.setMinimum(1)
+        self.tile_width_input.setMaximum(9999)
+        self.tile_width_input.setValue(256)
+
+        self.tile_height_input = QSpinBox()
+        self.tile_height_input.setSuffix("px")
+        self.tile_height_input.setMinimum(1)
+        self.tile_height_input.setMaximum(9999)
+        self.tile_height_input.setValue(256)
+
+        self.layout.addRow("Tile Width:", self.tile_width_input)
+        self.layout.addRow("Tile Height:", self.tile_height_input)
+        self.setLayout(self.layout)
+
+    def get_kwargs(self):
+        kwargs = dict()
+        kwargs["tile_width"] = self.tile_width_input.value()
+        kwargs["tile_height"] = self.tile_height_input.value()
+        return kwargs
+
+
 class PxShutterSortArgs(GlitchFunctionArgs):
     """ Pixel-length Shutter Sort parameters:
             Shutter Width/Height: integer
@@ -360,6 +395,7 @@ function_param_widgets = {
     "Rows": NoParams, "Columns": NoParams,
     "Diagonals": DiagonalArgs,
     "Wrapping Diagonals": NoParams,
+    "Tiles": TileArgs,
     "Shutters (px)": PxShutterSortArgs, "Variable Shutters (px)": PxVariableShutterSortArgs,
     "Shutters (%)": PctShutterSortArgs, "Variable Shutters (%)": PctVariableShutterSortArgs,
     "Random": RandomSizeArgs,
@@ -505,7 +541,7 @@ class PixelSortInput(QWidget):
         if self.rgb:
             sort_key_function = self.sort_key_function_cb.currentText()
         else:
-            sort_key_function = lambda x: x
+            sort_key_function = None
         reverse = self.reverse_checkbox.checkState()
         kwargs = dict()
         kwargs.update(self.group_function_params.get_kwargs())
@@ -713,7 +749,8 @@ class LineOffsetAuraInput(QWidget):
 
 class GlitchWidget(QWidget):
     """ Base class for widgets that execute glitches in GitchArtTools.
-    Any subclass of this must implement a method performGlitch(source_image:str) which returns a PIL Image
+    Any subclass of this must implement a method performGlitch(source_image:PIL.Image) which returns a PIL Image
+    source_image is always an RGB image.
     """
     def performGlitch(self, source_image):
         raise NotImplementedError
@@ -735,7 +772,6 @@ class PixelSortWidget(GlitchWidget):
         self.input_container = QWidget()
         self.input_container.setSizePolicy(expanding_policy)
         self.input_layout = QVBoxLayout(self.input_container)
-        self.pixelsort_input = []
         self.loadInputWidgets()
         self.scrollarea = QScrollArea()
         self.scrollarea.setWidgetResizable(True)
@@ -758,35 +794,42 @@ class PixelSortWidget(GlitchWidget):
 
 
     def channelsChanged(self, checked):
-        self._bandsort = checked
-        self.loadInputWidgets()
+        self._bandsort = bool(checked)
+        self.showInputWidgets()
 
+    # NOTE All of the input widgets are made once and hidden when they aren't used,
+    #      so toggling the checkbox doesn't rebuild them (and it keeps their settings).
     def loadInputWidgets(self):
-        for input_widget in self.pixelsort_input:
-            input_widget.setParent(None)
-            input_widet = None
-        if self._bandsort:
-            # Bandsort
-            red_input = PixelSortInput("Red", rgb=False)
-            red_input.setAutoFillBackground(True)
-            red_input.setBackgroundRole(QPalette.Light)
-            green_input = PixelSortInput("Green", rgb=False)
-            green_input.setAutoFillBackground(True)
-            green_input.setBackgroundRole(QPalette.Midlight)
-            blue_input = PixelSortInput("Blue", rgb=False)
-            blue_input.setAutoFillBackground(True)
-            blue_input.setBackgroundRole(QPalette.Light)
-            self.pixelsort_input = [red_input, green_input, blue_input]
-        else:
-            # RGB Pixelsort
-            rgb_input = PixelSortInput("3-Channel", rgb=True)
-            self.pixelsort_input = [rgb_input]
-        for widget in self.pixelsort_input:
+        # RGB Pixelsort
+        self.rgb_input = PixelSortInput("3-Channel", rgb=True)
+        # Bandsort
+        red_input = PixelSortInput("Red", rgb=False)
+        red_input.setAutoFillBackground(True)
+        red_input.setBackgroundRole(QPalette.Light)
+        green_input = PixelSortInput("Green", rgb=False)
+        green_input.setAutoFillBackground(True)
+        green_input.setBackgroundRole(QPalette.Midlight)
+        blue_input = PixelSortInput("Blue", rgb=False)
+        blue_input.setAutoFillBackground(True)
+        blue_input.setBackgroundRole(QPalette.Light)
+        self.band_input = [red_input, green_input, blue_input]
+        for widget in [self.rgb_input] + self.band_input:
             widget.setSizePolicy(QSizePolicy(QSizePolicy.Minimum, QSizePolicy.Minimum))
             self.input_layout.addWidget(widget)
+        self.showInputWidgets()
 
-    def performGlitch(self, source_filename, coords=None):
-        source_image = Image.open(source_filename)
+    def showInputWidgets(self):
+        self.rgb_input.setVisible(not self._bandsort)
+        for widget in self.band_input:
+            widget.setVisible(self._bandsort)
+
+    @property
+    def pixelsort_input(self):
+        if self._bandsort:
+            return self.band_input
+        return [self.rgb_input]
+
+    def performGlitch(self, source_image, coords=None):
         color_mods = self.color_mod_input.getValues()
         if self._bandsort:
             bands = []
@@ -827,9 +870,9 @@ class SwizzleWidget(GlitchWidget):
         self.layout.addRow(self.green_swap, green_label)
         self.layout.addRow(self.blue_swap, blue_label)
 
-    def performGlitch(self, source_filename, coords=None):
+    def performGlitch(self, source_image, coords=None):
         swaps = f'{self.red_swap.currentText()}{self.green_swap.currentText()}{self.blue_swap.currentText()}'
-        return swizzle.swizzle(source_filename, swaps, coords)
+        return swizzle.swizzle(source_image, swaps, coords)
 
 
 class LineOffsetWidget(GlitchWidget):
@@ -851,7 +894,6 @@ class LineOffsetWidget(GlitchWidget):
         self.input_container = QWidget()
         self.input_container.setSizePolicy(expanding_policy)
         self.input_layout = QVBoxLayout(self.input_container)
-        self.offset_input = []
         self.loadInputWidgets()
         self.scrollarea = QScrollArea()
         self.scrollarea.setWidgetResizable(True)
@@ -869,35 +911,42 @@ class LineOffsetWidget(GlitchWidget):
 
 
     def channelsChanged(self, checked):
-        self._splitbands = checked
-        self.loadInputWidgets()
+        self._splitbands = bool(checked)
+        self.showInputWidgets()
 
+    # NOTE All of the input widgets are made once and hidden when they aren't used,
+    #      so toggling the checkbox doesn't rebuild them (and it keeps their settings).
     def loadInputWidgets(self):
-        for input_widget in self.offset_input:
-            input_widget.setParent(None)
-            input_widet = None
-        if self._splitbands:
-            # Bandsort
-            red_input = LineOffsetInput("Red", False)
-            red_input.setAutoFillBackground(True)
-            red_input.setBackgroundRole(QPalette.Light)
-            green_input = LineOffsetInput("Green", False)
-            green_input.setAutoFillBackground(True)
-            green_input.setBackgroundRole(QPalette.Midlight)
-            blue_input = LineOffsetInput("Blue", False)
-            blue_input.setAutoFillBackground(True)
-            blue_input.setBackgroundRole(QPalette.Light)
-            self.offset_input = [red_input, green_input, blue_input]
-        else:
-            # RGB Pixelsort
-            rgb_input = LineOffsetInput("3-Channel")
-            self.offset_input = [rgb_input]
-        for widget in self.offset_input:
+        # RGB Offset
+        self.rgb_input = LineOffsetInput("3-Channel")
+        # Separate Bands
+        red_input = LineOffsetInput("Red", False)
+        red_input.setAutoFillBackground(True)
+        red_input.setBackgroundRole(QPalette.Light)
+        green_input = LineOffsetInput("Green", False)
+        green_input.setAutoFillBackground(True)
+        green_input.setBackgroundRole(QPalette.Midlight)
+        blue_input = LineOffsetInput("Blue", False)
+        blue_input.setAutoFillBackground(True)
+        blue_input.setBackgroundRole(QPalette.Light)
+        self.band_input = [red_input, green_input, blue_input]
+        for widget in [self.rgb_input] + self.band_input:
             widget.setSizePolicy(QSizePolicy(QSizePolicy.Minimum, QSizePolicy.Minimum))
             self.input_layout.addWidget(widget)
+        self.showInputWidgets()
+
+    def showInputWidgets(self):
+        self.rgb_input.setVisible(not self._splitbands)
+        for widget in self.band_input:
+            widget.setVisible(self._splitbands)
+
+    @property
+    def offset_input(self):
+        if self._splitbands:
+            return self.band_input
+        return [self.rgb_input]
 
-    def performGlitch(self, source_filename, coords=None):
-        source_image = Image.open(source_filename)
+    def performGlitch(self, source_image, coords=None):
         if self._splitbands:
             bands = []
             for band, band_input in zip(source_image.split(), self.offset_input):
@@ -928,7 +977,6 @@ class LineOffsetAuraWidget(GlitchWidget):
         self.input_container = QWidget()
         self.input_container.setSizePolicy(expanding_policy)
         self.input_layout = QVBoxLayout(self.input_container)
-        self.offset_input = []
         self.loadInputWidgets()
         self.scrollarea = QScrollArea()
         self.scrollarea.setWidgetResizable(True)
@@ -946,35 +994,42 @@ class LineOffsetAuraWidget(GlitchWidget):
 
 
     def channelsChanged(self, checked):
-        self._splitbands = checked
-        self.loadInputWidgets()
+        self._splitbands = bool(checked)
+        self.showInputWidgets()
 
+    # NOTE All of the input widgets are made once and hidden when they aren't used,
+    #      so toggling the checkbox doesn't rebuild them (and it keeps their settings).
     def loadInputWidgets(self):
-        for input_widget in self.offset_input:
-            input_widget.setParent(None)
-            input_widet = None
-        if self._splitbands:
-            # Bandsort
-            red_input = LineOffsetAuraInput("Red", False)
-            red_input.setAutoFillBackground(True)
-            red_input.setBackgroundRole(QPalette.Light)
-            green_input = LineOffsetAuraInput("Green", False)
-            green_input.setAutoFillBackground(True)
-            green_input.setBackgroundRole(QPalette.Midlight)
-            blue_input = LineOffsetAuraInput("Blue", False)
-            blue_input.setAutoFillBackground(True)
-            blue_input.setBackgroundRole(QPalette.Light)
-            self.offset_input = [red_input, green_input, blue_input]
-        else:
-            # RGB Pixelsort
-            rgb_input = LineOffsetAuraInput("3-Channel")
-            self.offset_input = [rgb_input]
-        for widget in self.offset_input:
+        # RGB Offset
+        self.rgb_input = LineOffsetAuraInput("3-Channel")
+        # Separate Bands
+        red_input = LineOffsetAuraInput("Red", False)
+        red_input.setAutoFillBackground(True)
+        red_input.setBackgroundRole(QPalette.Light)
+        green_input = LineOffsetAuraInput("Green", False)
+        green_input.setAutoFillBackground(True)
+        green_input.setBackgroundRole(QPalette.Midlight)
+        blue_input = LineOffsetAuraInput("Blue", False)
+        blue_input.setAutoFillBackground(True)
+        blue_input.setBackgroundRole(QPalette.Light)
+        self.band_input = [red_input, green_input, blue_input]
+        for widget in [self.rgb_input] + self.band_input:
             widget.setSizePolicy(QSizePolicy(QSizePolicy.Minimum, QSizePolicy.Minimum))
             self.input_layout.addWidget(widget)
+        self.showInputWidgets()
+
+    def showInputWidgets(self):
+        self.rgb_input.setVisible(not self._splitbands)
+        for widget in self.band_input:
+            widget.setVisible(self._splitbands)
 
-    def performGlitch(self, source_filename, coords=None):
-        source_image = Image.open(source_filename)
+    @property
+    def offset_input(self):
+        if self._splitbands:
+            return self.band_input
+        return [self.rgb_input]
+
+    def performGlitch(self, source_image, coords=None):
         if self._splitbands:
             bands = []
             for band, band_input in zip(source_image.split(), self.offset_input):
@@ -987,6 +1042,41 @@ class LineOffsetAuraWidget(GlitchWidget):
 
 glitch_widget_map = {"Pixelsort": PixelSortWidget, "Swizzle": SwizzleWidget, "Line Offsets": LineOffsetWidget, "Offset Auras": LineOffsetAuraWidget}
 
+#--------------------------------------------------------------------------
+# Background Tasks
+#--------------------------------------------------------------------------
+
+class SaveImageSignals(QObject):
+    """ QRunnable is not a QObject so SaveImageTask keeps its signals in here. """
+    finished = Signal(str)
+    failed = Signal(str)
+
+class SaveImageTask(QRunnable):
+    """ Saves a PIL Image in a QThreadPool thread so encoding the file doesn't block the GUI.
+    signals.finished emits the filename once the file is written, signals.failed emits it if saving raised.
+    """
+    def __init__(self, pil_image, filename):
+        super().__init__()
+        self.pil_image = pil_image
+        self.filename = filename
+        self.signals = SaveImageSignals()
+
+    def run(self):
+        try:
+            self.pil_image.save(self.filename)
+        except Exception as error:
+            # Disk full, no permission, temp directory removed... the GUI still has to hear back about this file
+            print(f"File ({self.filename}) not saved: {error}")
+            self.signals.failed.emit(self.filename)
+        else:
+            self.signals.finished.emit(self.filename)
+
+class WarmUpTask(QRunnable):
+    """ Compiles the kernels in a QThreadPool thread at startup so neither the GUI nor the first glitch waits for numba. """
+    def run(self):
+        import kernels
+        kernels.warm_up()
+
 #--------------------------------------------------------------------------
 # Main Application
 #--------------------------------------------------------------------------
@@ -1002,12 +1092,17 @@ class GlitchArtTools(QWidget):
         util.setup_image_path(self.default_path) # Set up input, output, and temp image directories
         self.default_path = os.path.join(self.default_path, "glitch")
         self.source_filename = None
+        self.source_image = None
         self.glitch_filename = None
+        # Temp files that a SaveImageTask is still writing. They are deleted once saved, not while the task has them open.
+        self.saving_filenames = set()
         self._size_hint = screen_size
         self.default_pixmap_max_size = self.sizeHint() * 3 / 8
 
         self.initUI()
         self.setWindowTitle("Glitch Art Tools - Pixel Sorting")
+        # The kernels are compiled once, in the background, while the user picks an image
+        QThreadPool.globalInstance().start(WarmUpTask())
 
     def sizeHint(self):
         return self._size_hint
@@ -1111,9 +1206,10 @@ class GlitchArtTools(QWidget):
         return self.frameSize() / 2
 
     def openImageInNewWindow(self, q_image):
+        # The glitch is opened from memory since its temp file might still be being written
         if q_image == "glitch":
-            filename = self.glitch_filename
-        self.temp_window = ScrollableImageViewer(filename)
+            self.temp_window = ScrollableImageViewer()
+            self.temp_window.setImage(self.glitch_qimage, label=self.glitch_filename)
         self.temp_window.show()
 
     def setImageFromLineInput(self):
@@ -1138,20 +1234,30 @@ class GlitchArtTools(QWidget):
 
     def setSourceImage(self, filename, clear_region=True):
         self.source_filename = filename
+        # The image is opened and converted to RGB once here instead of every time a glitch is performed.
+        # The glitches and the band splitting all expect RGB (files can be P, L, RGBA...)
+        source_image = Image.open(filename)
+        if source_image.mode != "RGB":
+            source_image = source_image.convert("RGB")
+        source_image.load()
+        self.source_image = source_image
         self.image_source_input.setText(self.source_filename)
         self.source_image_viewer.setImage(self.source_filename, clear_region)
         self.glitch_it_button.setEnabled(True)
 
     # NOTE
-    # For some reason using ImageQt to convert the PIL Image to a QImage and then
-    # using QPixmap.fromImage causes the pixmap to be translucent
-    # So for now I don't do that. Instead I just load the pixmap using the filename
-    # This is why util.make_temp_image sets the pil_image.filename
+    # Using ImageQt to convert the PIL Image made the pixmap translucent because it converts to ARGB32.
+    # Building the QImage from the RGB buffer as Format_RGB888 avoids that (and the 8 to 32 bit expansion)
+    # so the viewer doesn't have to reload the image from the temp file.
+    # The QImage doesn't own the buffer, so glitch_array has to be kept alive as long as glitch_qimage is.
     def setGlitchImage(self, pil_image):
-        self.glitch_qimage = ImageQt(pil_image)
         self.glitch_filename = pil_image.filename
-        self.glitch_image_viewer.setImage(self.glitch_filename)
-        self.swap_glitch_button.setEnabled(True)
+        if pil_image.mode != "RGB":
+            pil_image = pil_image.convert("RGB")
+        self.glitch_array = np.ascontiguousarray(np.asarray(pil_image))
+        height, width, _ = self.glitch_array.shape
+        self.glitch_qimage = QImage(self.glitch_array.data, width, height, 3 * width, QImage.Format_RGB888)
+        self.glitch_image_viewer.setImage(self.glitch_qimage, label=self.glitch_filename)
         self.save_glitch_copy.setEnabled(True)
 
     def setGlitchAsSource(self):
@@ -1168,22 +1274,50 @@ class GlitchArtTools(QWidget):
             #not_saved_message = QMessageBox("
 
     def performGlitch(self):
-        if self.glitch_filename and not (self.glitch_filename == self.source_filename):
+        if self.glitch_filename and not (self.glitch_filename == self.source_filename) and self.glitch_filename not in self.saving_filenames:
             # NOTE : improve file deletion
+            # A file that is still being saved is deleted by glitchFileSaved when it's done
             self.deleteImage(self.glitch_filename)
         coords = None
         coords_rect = self.source_image_viewer.rb_rect
         if coords_rect:
             coords = (coords_rect.x(), coords_rect.y(), coords_rect.x() + coords_rect.width(), coords_rect.y() + coords_rect.height())
 
-        glitch_image = self.glitch_widget.performGlitch(self.source_filename, coords)
-        util.make_temp_file(glitch_image, os.path.join(self.default_path, "temp"))
+        glitch_image = self.glitch_widget.performGlitch(self.source_image, coords)
+        # The viewer shows the glitch from memory so the temp file is written in the background.
+        # It can't be used as the input until the file exists.
+        glitch_image.filename = util.make_temp_filename(os.path.join(self.default_path, "temp"))
         self.image_tabs.setCurrentWidget(self.image_output_tab)
         self.setGlitchImage(glitch_image)
+        self.swap_glitch_button.setEnabled(False)
+        save_task = SaveImageTask(glitch_image, glitch_image.filename)
+        save_task.signals.finished.connect(self.glitchFileSaved)
+        save_task.signals.failed.connect(self.glitchFileFailed)
+        self.saving_filenames.add(glitch_image.filename)
+        QThreadPool.globalInstance().start(save_task)
+
+    def glitchFileSaved(self, filename):
+        self.saving_filenames.discard(filename)
+        if filename == self.glitch_filename:
+            self.swap_glitch_button.setEnabled(True)
+        else:
+            # Another glitch was made while this one was being saved, so this file is not needed anymore
+            self.deleteImage(filename)
+
+    def glitchFileFailed(self, filename):
+        self.saving_filenames.discard(filename)
+        if filename == self.glitch_filename:
+            # There's no file to use as the input
+            self.swap_glitch_button.setEnabled(False)
+        # Remove whatever part of the file was written
+        self.deleteImage(filename)
 
     def deleteImage(self, filename):
-        if os.path.exists(filename):
+        try:
             os.remove(filename)
+        except OSError:
+            # Already gone, or still open somewhere (Windows won't remove open files). It's only a temp file.
+            pass
 
 
 def main():
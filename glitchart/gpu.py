@@ -0,0 +1,33 @@
+""" gpu - sorting on the graphics card with CuPy. It's only used if CuPy is installed and can find a GPU. """
+# Copyright (c) 2021 Mark Schloeman
+
+try:
+    import cupy as cp
+    available = cp.cuda.runtime.getDeviceCount() > 0
+except Exception:
+    # ImportError when CuPy isn't installed, a CUDA error when there's no card to use
+    cp = None
+    available = False
+
+
+def sort_lines(pixels, keys, line_length, reverse):
+    """ Sort lines of pixels that are all the same length. Gives the same result as kernels.sort_lines.
+
+    :param pixels: a numpy array of pixels with shape (n, channels) or (n). The lines are one after another.
+    :param keys: a float64 or int16 numpy array with the key of each pixel.
+    :param line_length: the number of pixels in each line.
+    :param reverse: if True each line is sorted from the highest key to the lowest.
+    :returns: a numpy array of sorted pixels with the same shape as pixels.
+    """
+    line_count = len(pixels) // line_length
+    gpu_keys = cp.asarray(keys).reshape(line_count, line_length)
+    # A stable sort of the negative keys keeps equal pixels in order, the same as sorted(reverse=True)
+    if reverse:
+        gpu_keys = -gpu_keys
+    order = cp.argsort(gpu_keys, axis=1, kind="stable")
+    gpu_pixels = cp.asarray(pixels).reshape(line_count, line_length, *pixels.shape[1:])
+    # RGB pixels have a channel axis, so the order needs one too to pick whole pixels. Bands use the order as it is.
+    if pixels.ndim == 2:
+        order = order[:, :, None]
+    sorted_pixels = cp.take_along_axis(gpu_pixels, order, axis=1)
+    return cp.asnumpy(sorted_pixels).reshape(pixels.shape)
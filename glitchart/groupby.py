@@ -3,60 +3,92 @@
 
 import random
 import math
+import functools
+from enum import IntEnum
+
+import numpy as np
 
 from pixelstats import *
 
 # Shape delineation - yield / return pixels from the list based on the shape of the image
 ####################################################
+# NOTE : all of these work on numpy arrays of pixels with the shape (width * height) for bands
+#        or (width * height, channels) for RGB images, and the lines they yield are numpy arrays too.
+#        linear, rows and columns only reshape the array so the lines they yield are views of source_pixels.
+#        Keep in mind that column views are not contiguous.
 def linear(source_pixels, *args, **kwargs):
-    """ Keeps a list of pixels as a 1 dimensional array.  This function is only necessary to keep the api consistent.
+    """ Keeps an array of pixels as a 1 dimensional array.  This function is only necessary to keep the api consistent.
     
-    :param: source_pixels: a list of pixels.
-    :returns: a list containing a list of pixels.
+    :param: source_pixels: a numpy array of pixels.
+    :returns: a list containing the array of pixels.
     """
 
     return [source_pixels]
 
 def rows(source_pixels, source_size, **kwargs):
-    """ Generator that yields rows from a list of pixels. 
+    """ Generator that yields rows from an array of pixels.
 
-    :param source_pixels: a list of pixels.
+    :param source_pixels: a numpy array of pixels.
     :param source_size:   an interable containing the image's (width, height).
-    :returns: rows as lists of pixels.
+    :returns: rows as views of source_pixels.
     """
 
-    for x in range(0, len(source_pixels), source_size[0]):
-        yield source_pixels[x : x + source_size[0]]
+    pixel_array = np.asarray(source_pixels)
+    yield from pixel_array.reshape(source_size[1], source_size[0], *pixel_array.shape[1:])
 
 
 
 # NOTE : this messes up the order of the pixels.
 #        you need to transpose the list after using this
 def columns(source_pixels, source_size, **kwargs):
-    """ Generator that yields columns from a list of pixels. 
-    NOTE : in order to use this properly you must use the function transpose_list afterwards because this will mess up the shape of the image.
+    """ Generator that yields columns from an array of pixels.
+    NOTE : in order to use this properly you must use the function columns_fix afterwards because this will mess up the shape of the image.
 
-    :param source_pixels: a list of pixels.
+    :param source_pixels: a numpy array of pixels.
     :param source_size:   an interable containing the image's (width, height).
-    :returns: columns as lists of pixels.
+    :returns: columns as views of source_pixels.
     """
 
-    for x in range(0, source_size[0]):
-        yield source_pixels[x : : source_size[0]]
+    pixel_array = np.asarray(source_pixels)
+    yield from pixel_array.reshape(source_size[1], source_size[0], *pixel_array.shape[1:]).swapaxes(0, 1)
 
 def columns_fix(source_list, source_size, **kwargs):
-    """ Transpose a list so its columns are rows.
+    """ Transpose an array so its columns are rows.
 
-    :param source_list: a list of pixels.
-    :param pitch: PIL Image size attribute, a tuple with two ints.
-    :returns: a list of pixels.
+    :param source_list: a numpy array (or list) of pixels.
+    :param source_size: PIL Image size attribute, a tuple with two ints.
+    :returns: a contiguous numpy array of pixels.
     """
 
-    result = []
-    for y in range(0, source_size[1]):
-        result += source_list[y :: source_size[1]]
-    return result
+    pixel_array = np.asarray(source_list)
+    channels = pixel_array.shape[1:]
+    return np.ascontiguousarray(pixel_array.reshape(source_size[0], source_size[1], *channels).swapaxes(0, 1)).reshape(-1, *channels)
+
 
+@functools.lru_cache(maxsize=8)
+def diagonals_indices(width, height, flip_slope):
+    """ Build the index maps used by diagonals and diagonals_fix for an image size.
+    Pixel (x, y) is on diagonal x - y + height - 1 at index min(x, y). When flip_slope is True y is counted from the bottom.
+    The arrays are cached so don't modify them.
+
+    :param width:      the image's width.
+    :param height:     the image's height.
+    :param flip_slope: the flip_slope passed to diagonals.
+    :returns: a tuple (starts, scatter) of int arrays. Diagonal i is diagonal_pixels[starts[i] : starts[i + 1]]
+              and diagonal_pixels[scatter] puts them back.
+    """
+    diagonal_numbers = np.arange(width + height - 1)
+    lengths = np.minimum(np.minimum(diagonal_numbers + 1, width + height - 1 - diagonal_numbers), min(width, height))
+    starts = np.zeros(width + height, dtype=np.int64)
+    np.cumsum(lengths, out=starts[1:])
+    x = np.arange(width)[None, :]
+    y = np.arange(height)[:, None]
+    if flip_slope:
+        y = height - 1 - y
+    scatter = (starts[x - y + height - 1] + np.minimum(x, y)).reshape(-1)
+    starts.flags.writeable = False
+    scatter.flags.writeable = False
+    return starts, scatter
 
 def diagonals(source_pixels, source_size, flip_slope=False, **kwargs):
     """ Generator that yields diagonal lines from an image. Starts from one corner to the opposite.
@@ -65,110 +97,136 @@ def diagonals(source_pixels, source_size, flip_slope=False, **kwargs):
     It yields diagonal lines going down and to the right, stopping at the opposite border.
     TODO : add options to start at any corner.
 
-    :param source_pixels: a list of pixels.
+    :param source_pixels: a numpy array of pixels.
     :param source_size:   an interable containing the image's (width, height).
-    :param corner:        a flag that determines which direction the lines run
-                          True = backslash False = forwardslash
-    :returns: columns as lists of pixels.
+    :param flip_slope:    a flag that determines which direction the lines run
+                          False = backslash True = forwardslash
+    :returns: diagonals as numpy arrays of pixels.
     """
+    import kernels
     pitch, height = source_size
-    if flip_slope: # Lines look like this: /
-        start_x = 0
-        start_y = 0
-        end_y = height - 1
-        x_inc = 1
-        y_inc = -1
-        y_border = -1
-    else: # Lines look like this: \
-        start_x = 0
-        start_y = height - 1
-        end_y = 0
-        x_inc = 1
-        y_inc = 1
-        y_border = height
-
-    for i in range(source_size[0] + source_size[1] - 1):
-        line = []
-        x = start_x
-        y = start_y
-        while y != y_border and x < pitch:
-            line.append(source_pixels[x + (y * pitch)])
-            x += x_inc
-            y += y_inc
-        if start_y != end_y:
-            start_y -= y_inc
-        else:
-            start_x += x_inc
-        yield line
+    pixel_array = np.ascontiguousarray(source_pixels)
+    starts, _ = diagonals_indices(pitch, height, bool(flip_slope))
+    # All of the diagonals are copied into one array and yielded as views of it
+    lines = np.empty_like(pixel_array)
+    kernels.diagonal_lines(pixel_array.reshape(height, pitch, *pixel_array.shape[1:]), lines, starts, flip_slope)
+    for i in range(pitch + height - 1):
+        yield lines[starts[i] : starts[i + 1]]
 
 def diagonals_fix(source_pixels, source_size, flip_slope=False, **kwargs):
-    pitch, height = source_size
-    if flip_slope:
-        x = start_x = 0
-        y = start_y = 0
-        end_y = height - 1
-        y_border = -1
-        x_inc = 1
-        y_inc = -1
-    else:
-        x = start_x = 0
-        y = start_y = height - 1
-        end_y = 0
-        y_border = height
-        x_inc = 1
-        y_inc = 1
-    # This is probably pretty slow but it's the easiest way I can think to do this rn
-    result = [0] * (pitch * height)
-    for pixel in source_pixels:
-        result[x + (y * pitch)] = pixel
-        x += x_inc
-        y += y_inc
-        if x == pitch or y == y_border:
-            if start_y != end_y:
-                start_y -= y_inc
-            else:
-                start_x += x_inc
-            x = start_x
-            y = start_y
-    return result
+    """ Put pixels from the diagonals generator back in their place.
 
+    :param source_pixels: a numpy array (or list) of pixels in the order diagonals yielded them.
+    :param source_size:   an interable containing the image's (width, height).
+    :param flip_slope:    the flip_slope that was passed to diagonals.
+    :returns: a numpy array of pixels.
+    """
+    _, scatter = diagonals_indices(source_size[0], source_size[1], bool(flip_slope))
+    return np.asarray(source_pixels)[scatter]
+
+
+@functools.lru_cache(maxsize=8)
+def wrapping_diagonals_indices(width, height):
+    """ Build the permutation used by wrapping_diagonals and its inverse for an image size.
+    Diagonal x, pixel y is the source pixel ((x + y) % width) + (y * width).
+    The arrays are cached so don't modify them.
+
+    :param width:  the image's width.
+    :param height: the image's height.
+    :returns: a tuple (gather, scatter) of int arrays. gather has the shape (height, width), row y of image[gather]
+              is the y-th pixel of every diagonal. diagonal_pixels[scatter] puts the diagonals back.
+    """
+    # Each row of gather reads one row of the image from left to right (wrapping once)
+    # so the image is read in order instead of jumping a row for every pixel.
+    x = np.arange(width)[None, :]
+    y = np.arange(height)[:, None]
+    gather = ((x + y) % width) + (y * width)
+    scatter = np.empty(width * height, dtype=gather.dtype)
+    scatter[gather.T.reshape(-1)] = np.arange(width * height)
+    gather.flags.writeable = False
+    scatter.flags.writeable = False
+    return gather, scatter
 
 def wrapping_diagonals(source_pixels, source_size, **kwargs):
-    """ Generator that yields diagonals from a list of pixels.
+    """ Generator that yields diagonals from an array of pixels.
 
     This generator starts at the top left of the image (index 0 of the array) and yields lines going down and to
     the right. This one wraps around the image when it reaches a border.
 
-    :param source_pixels: a list of pixels.
+    :param source_pixels: a numpy array of pixels.
     :param source_size:   an interable containing the image's (width, height).
-    :returns: columns as lists of pixels.
+    :returns: diagonals as numpy arrays of pixels.
     """
-    # This function is making me realize that using indices to access the array would be convenient.
-    for x in range(source_size[0]):
-        x_index = x
-        line = []
-        for y in range(source_size[1]):
-            if x_index >= source_size[0]:
-                x_index = 0
-            line.append(source_pixels[x_index + (y * source_size[0])])
-            x_index += 1
-        yield line
+    pixel_array = np.asarray(source_pixels)
+    gather, _ = wrapping_diagonals_indices(*source_size)
+    # Column x of the gathered array is diagonal x
+    yield from pixel_array[gather].swapaxes(0, 1)
 
 def wrapping_diagonals_fix(source_pixels, source_size, **kwargs):
-    result = []
-    index = 0
-    row_length = 0
-    for _ in range(len(source_pixels)):
-            result.append(source_pixels[index])
-            row_length += 1
-            if row_length == source_size[0]:
-                index += 1
-                row_length = 0
-            else:
-                index += source_size[1]
-            if index > len(source_pixels):
-                index %= len(source_pixels)
-    return result
+    """ Put pixels from the wrapping_diagonals generator back in their place.
+
+    :param source_pixels: a numpy array (or list) of pixels in the order wrapping_diagonals yielded them.
+    :param source_size:   an interable containing the image's (width, height).
+    :returns: a numpy array of pixels.
+    """
+    _, scatter = wrapping_diagonals_indices(*source_size)
+    return np.asarray(source_pixels)[scatter]
+
+@functools.lru_cache(maxsize=8)
+def tiles_indices(width, height, tile_width, tile_height):
+    """ Build the permutation used by tiles and its inverse for an image size.
+    The tiles go left to right, top to bottom and so do the pixels in each tile.
+    The tiles on the right and bottom edges are smaller if the image doesn't divide evenly.
+    The arrays are cached so don't modify them.
+
+    :param width:       the image's width.
+    :param height:      the image's height.
+    :param tile_width:  the width of each tile.
+    :param tile_height: the height of each tile.
+    :returns: a tuple (gather, scatter, starts) of int arrays. image[gather] is the tiles one after another,
+              tile i is tile_pixels[starts[i] : starts[i + 1]] and tile_pixels[scatter] puts them back.
+    """
+    image_indices = np.arange(width * height).reshape(height, width)
+    tile_indices = [image_indices[y : y + tile_height, x : x + tile_width].reshape(-1)
+                    for y in range(0, height, tile_height)
+                    for x in range(0, width, tile_width)]
+    gather = np.concatenate(tile_indices)
+    starts = np.zeros(len(tile_indices) + 1, dtype=np.int64)
+    np.cumsum([len(indices) for indices in tile_indices], out=starts[1:])
+    scatter = np.empty_like(gather)
+    scatter[gather] = np.arange(len(gather))
+    for array in (gather, scatter, starts):
+        array.flags.writeable = False
+    return gather, scatter, starts
+
+def tiles(source_pixels, source_size, tile_width=256, tile_height=256, **kwargs):
+    """ Generator that yields rectangular tiles from an array of pixels. Each tile is yielded as one line.
+    NOTE : use tiles_fix afterwards to put the pixels back in their place.
+
+    :param source_pixels: a numpy array of pixels.
+    :param source_size:   an interable containing the image's (width, height).
+    :param tile_width:    the width of each tile in pixels.
+    :param tile_height:   the height of each tile in pixels.
+    :returns: tiles as numpy arrays of pixels.
+    """
+    pixel_array = np.asarray(source_pixels)
+    gather, _, starts = tiles_indices(source_size[0], source_size[1], tile_width, tile_height)
+    # All of the tiles are gathered into one array and yielded as views of it
+    tile_pixels = pixel_array[gather]
+    for i in range(len(starts) - 1):
+        yield tile_pixels[starts[i] : starts[i + 1]]
+
+def tiles_fix(source_pixels, source_size, tile_width=256, tile_height=256, **kwargs):
+    """ Put pixels from the tiles generator back in their place.
+
+    :param source_pixels: a numpy array (or list) of pixels in the order tiles yielded them.
+    :param source_size:   an interable containing the image's (width, height).
+    :param tile_width:    the tile_width that was passed to tiles.
+    :param tile_height:   the tile_height that was passed to tiles.
+    :returns: a numpy array of pixels.
+    """
+    _, scatter, _ = tiles_indices(source_size[0], source_size[1], tile_width, tile_height)
+    return np.asarray(source_pixels)[scatter]
 
 # Generators / Functions that yield / return sortable tuples.
 # The first item is the list of pixels
@@ -191,7 +249,7 @@ def linear_sort(source_pixels, **kwargs):
 def shutters_px(source_pixels, shutter_size=None, **kwargs):
     """ Generator that yields chunks of the image to be sorted. The chunk size is given in pixels.
 
-    :param source_pixels: a list of pixels.
+    :param source_pixels: a list or numpy array of pixels. Chunks of an array are views, so nothing is copied.
     :param shutter_size:  an integer that tells how many pixels to yield at once. If not it will be 1/10 the length of source_pixels.
     :returns: tuples containing a chunk of the source pixels and a sorting flag.
     """
@@ -200,24 +258,42 @@ def shutters_px(source_pixels, shutter_size=None, **kwargs):
     for index in range(0, len(source_pixels), shutter_size):
         yield (source_pixels[index : index + shutter_size], True)
 
+def shutter_rng(seed=None):
+    """ Make a numpy random Generator from a seed.
+
+    :param seed: something compatible with python's random.seed(). numpy doesn't take strings or bytes so those are
+                 turned into an int with python's random first.
+    :returns: a numpy.random.Generator.
+    """
+    if seed is not None and not isinstance(seed, int):
+        seed = random.Random(seed).getrandbits(128)
+    return np.random.default_rng(seed)
+
 def variable_shutters_px(source_pixels, min_size=None, max_size=None, seed=None, **kwargs):
     """ Generator that yields chunks that vary between a minimum and maximum size. The chunk size is given in pixels.
 
-    :param source_pixels: a list of pixels.
+    :param source_pixels: a list or numpy array of pixels.
     :param min_size:  an integer that determines the minimum number of pixels to yield
     :param max_size:  an integer that determines the maximum number of pixels to yield
     :param seed:      something compatible with python's random.seed().
     :returns: tuples containing a chunk of the source pixels and a sorting flag.
     """
-    random.seed(seed)
+    rng = shutter_rng(seed)
+    pixel_count = len(source_pixels)
     if min_size is None:
-        min_size = len(source_pixels) // 10
+        min_size = pixel_count // 10
+    # A shutter size of 0 would never get to the end of the line
+    min_size = max(min_size, 1)
     if max_size is None:
-        max_size = min_size * 1.5
+        # randint only takes integers, min_size * 1.5 is a float
+        max_size = int(min_size * 1.5)
 
+    # Draw all of the sizes at once. There are enough that they reach the end even if every shutter is min_size.
+    shutter_sizes = rng.integers(min_size, max_size, size=pixel_count // min_size + 1, endpoint=True)
     left_index = 0
-    while left_index < len(source_pixels):
-        right_index = left_index + random.randint(min_size, max_size)
+    for right_index in np.cumsum(shutter_sizes).tolist():
+        if left_index >= pixel_count:
+            break
         yield (source_pixels[left_index : right_index], True)
         left_index = right_index
 
@@ -225,7 +301,7 @@ def shutters_pct(source_pixels, shutter_size=None, **kwargs):
     """ Generator that yields chunks of the image to be sorted.
     The chunk size is given as a percent of the source_pixels.
 
-    :param source_pixels: a list of pixels.
+    :param source_pixels: a list or numpy array of pixels.
     :param shutter_size:  a double in range (0.0 - 1.0] that tells how many pixels to yield at once as a % of source_pixels.
     :returns: tuples containing a chunk of the source pixels and a sorting flag.
     """
@@ -240,26 +316,38 @@ def variable_shutters_pct(source_pixels, min_size=None, max_size=None, seed=None
     """ Generator that yields chunks that vary between a minimum and maximum fraction of source_pixels.
     The min and max sizes are given as a range of percentages.
 
-    :param source_pixels: a list of pixels.
+    :param source_pixels: a list or numpy array of pixels.
     :param min_size:  a double (0.0 - 1.0] that determines the minimum fraction of pixels to yield
     :param max_size:  a double (0.0 - 1.0] that determines the maximum fraction of pixels to yield
     :param seed:      something compatible with python's random.seed().
     :returns: tuples containing a chunk of the source pixels and a sorting flag.
     """
-    random.seed(seed)
+    rng = shutter_rng(seed)
+    pixel_count = len(source_pixels)
     if not min_size:
         min_size = 0.01
     if max_size is None:
         max_size = 0.2
 
+    # Draw all of the sizes at once, like variable_shutters_px. Every shutter is at least this many pixels.
+    smallest_shutter = max(int(pixel_count * min(min_size, max_size)), 1)
+    # NOTE not rng.uniform, it doesn't allow max_size < min_size and the GUI does
+    shutter_sizes = min_size + (max_size - min_size) * rng.random(pixel_count // smallest_shutter + 1)
+    shutter_sizes = np.maximum((pixel_count * shutter_sizes).astype(np.int64), 1)
     left_index = 0
-    while left_index < len(source_pixels):
-        shutter_size = min_size + (max_size - min_size) * random.random()
-        right_index = left_index +  max(int(len(source_pixels) * shutter_size), 1)
+    for right_index in np.cumsum(shutter_sizes).tolist():
+        if left_index >= pixel_count:
+            break
         yield (source_pixels[left_index : right_index], True)
         left_index = right_index
 
 
+# Brightness of every pixel in a line for the tracer generators, picked by the line's number of dimensions.
+# 1 is a single band and 2 is RGB. They return an int16 array and the highest brightness possible.
+tracer_brightness = {
+    1: lambda line: (line.astype(np.int16), 255),
+    2: lambda line: (brightness_fast_u16(line).astype(np.int16), 1530)}
+
 # Complex generators that yield list based on pixel characteristics
 # NOTE : these won't work on bands
 # TODO : make more parameters - tracer length, contrast function, mask
@@ -273,37 +361,31 @@ def tracers(line, tracer_length=44, border_width=2, variance_threshold=None, **k
         :param variance_threshold: a number between 0.0 and 1.0 that determines the difference in brightness required for two pixels to be considered a border.
         :returns: tuples containing a list of pixels and a sorting flag.
     """
-    if isinstance(line[0], int):
-        variance_metric = lambda x: x/255
-    else:
-        variance_metric = brightness_fast
-    variance_threshold = variance_threshold or 0.25
+    import kernels
+    line_array = np.asarray(line)
+    variance_metric, brightness_range = tracer_brightness[line_array.ndim](line_array)
+    # Brightness is compared as integers, the threshold is scaled to the same range
+    variance_threshold = (variance_threshold or 0.25) * brightness_range
+    # A pixel is at a border when the next border_width - 1 pixels are all different enough from it.
+    # Every pixel is tested up front, then kernels.tracer_starts jumps from border to border.
+    check_length = max(len(line_array) - border_width, 0)
+    at_border = np.ones(check_length, dtype=bool)
+    for offset in range(1, border_width):
+        at_border &= np.abs(variance_metric[: check_length] - variance_metric[offset : check_length + offset]) >= variance_threshold
+    starts = np.empty(check_length, dtype=np.int64)
+    tracer_count = kernels.tracer_starts(at_border, tracer_length, starts)
     # TODO
     # sort_list flag is used in an attempt to avoid making a tracer on the inside of an
     # object in the image instead of trailing on the outside.
     # Though it doesn't work if the object in the image starts at index 0.
     # So this will have to be changed
-    sort_list = False
+    # NOTE the flag never stopped anything, a border that sets it is checked again right away and starts the tracer.
     group_start = 0
-    x = 0
-    while x < (len(line) - border_width):
-        at_border = True
-        for x2 in range(x + 1, min(len(line), x + border_width)):
-            if (abs(variance_metric(line[x]) - variance_metric(line[x2])) < variance_threshold):
-                at_border = False
-                break
-        if at_border:
-            if sort_list:
-                yield (line[group_start : x], False)
-                tracer_end = min(len(line), x + tracer_length)
-                yield (line[x : tracer_end], True)
-                group_start = tracer_end
-                x = tracer_end
-                sort_list = False
-            else:
-                sort_list = True
-        else:
-            x += 1
+    for x in starts[: tracer_count].tolist():
+        yield (line[group_start : x], False)
+        tracer_end = min(len(line_array), x + tracer_length)
+        yield (line[x : tracer_end], True)
+        group_start = tracer_end
     yield (line[group_start :], False)
 
 
@@ -322,25 +404,41 @@ def tracers_wobbly(line, tracer_length=44, border_width=2, **kwargs):
         :param border_width: how many pixels need to satisfy the border condition in a row to trigger the tracer effect.
         :returns: tuples containing a list of pixels and a sorting flag.
     """
-    if isinstance(line[0], int):
-        variance_metric = lambda x: x
-    else:
-        variance_metric = brightness_fast
-    variance_threshold = 0.2
+    import kernels
+    line_array = np.asarray(line)
+    variance_metric, brightness_range = tracer_brightness[line_array.ndim](line_array)
+    # NOTE single bands aren't scaled to 0.0 - 1.0 like the brightness is, so any difference counts as a border
+    variance_threshold = 0.2 * brightness_range if line_array.ndim == 2 else 0.2
+    # Pixel i is at a border when each of the next border_width pixels is different enough from it
+    check_length = max(len(line_array) - border_width, 0)
+    at_border = np.ones(check_length, dtype=bool)
+    for offset in range(1, border_width + 1):
+        at_border &= np.abs(variance_metric[: check_length] - variance_metric[offset : check_length + offset]) >= variance_threshold
+    # Each tracer also skips the border pixel, that's what makes it wobble
+    starts = np.empty(check_length, dtype=np.int64)
+    tracer_count = kernels.tracer_starts(at_border, tracer_length + 1, starts)
     i = 0
-    while i < len(line):
-        border = True
-        for j in range(1, border_width + 1):
-            if i + j >= len(line) or abs(variance_metric(line[i]) - variance_metric(line[j])) < variance_threshold:
-                border = False
-        if border:
-            yield (line[i + 1 : i + tracer_length + 1], True)
-            i += tracer_length + 1
-        else:
-            yield ([line[i]], True)
-            i += 1
-
-
-group_generators = {"Linear": linear, "Rows": rows, "Columns": columns, "Diagonals": diagonals, "Wrapping Diagonals": wrapping_diagonals}
-group_transpose_generators = {columns: columns_fix, diagonals: diagonals_fix, wrapping_diagonals: wrapping_diagonals_fix}
+    for tracer_start in starts[: tracer_count].tolist():
+        for pixel in line[i : tracer_start]:
+            yield ([pixel], True)
+        yield (line[tracer_start + 1 : tracer_start + tracer_length + 1], True)
+        i = tracer_start + tracer_length + 1
+    for pixel in line[i :]:
+        yield ([pixel], True)
+
+
+group_generators = {"Linear": linear, "Rows": rows, "Columns": columns, "Diagonals": diagonals, "Wrapping Diagonals": wrapping_diagonals, "Tiles": tiles}
+group_transpose_generators = {columns: columns_fix, diagonals: diagonals_fix, wrapping_diagonals: wrapping_diagonals_fix, tiles: tiles_fix}
+
+# The group generators can also be picked by number. GroupKind indexes group_functions, the fix functions are then
+# found with group_transpose_generators like for any other group function.
+class GroupKind(IntEnum):
+    LINEAR = 0
+    ROWS = 1
+    COLUMNS = 2
+    DIAGONALS = 3
+    WRAPPING_DIAGONALS = 4
+    TILES = 5
+
+group_functions = (linear, rows, columns, diagonals, wrapping_diagonals, tiles)
 sort_generators = {"Linear": linear_sort, "Shutters (px)": shutters_px, "Variable Shutters (px)": variable_shutters_px, "Shutters (%)": shutters_pct, "Variable Shutters (%)": variable_shutters_pct, "Random": variable_shutters_pct, "Tracers": tracers, "Wobbly Tracers": tracers_wobbly}
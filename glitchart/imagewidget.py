@@ -1,17 +1,46 @@
 """ imagewidget - working on a widget to contain the images in glitchart-qt """
 # Copyright (c) 2021 Mark Schloeman
 
-from PySide6.QtWidgets import QLabel, QWidget, QVBoxLayout, QHBoxLayout, QSlider, QGraphicsScene, QGraphicsView, QSizePolicy, QPushButton
-from PySide6.QtGui import QPixmap, QPainter, QBrush, QPen
-from PySide6.QtCore import Qt, Signal, QRectF, QPointF, QRect, QPoint
-
+import os
+import math
 
-def clamp(x, start, width):
-    return int(min(max(x, start), start + width))
+from PySide6.QtWidgets import QLabel, QWidget, QVBoxLayout, QHBoxLayout, QSlider, QGraphicsScene, QGraphicsView, QSizePolicy, QPushButton
+from PySide6.QtGui import QPixmap, QPixmapCache, QImage, QPainter, QBrush, QPen, QTransform
+from PySide6.QtCore import Qt, Signal, QRectF, QPointF, QRect, QPoint, QTimer
+try:
+    from PySide6.QtOpenGLWidgets import QOpenGLWidget
+except ImportError:
+    # Some PySide6 builds don't have OpenGL, the view just draws with the CPU then
+    QOpenGLWidget = None
+
+
+# Images bigger than this on both sides get smaller copies to show when zoomed out, see ZoomableGraphicsView.
+PYRAMID_MIN_SIZE = 512
+
+# Size of QPixmapCache in KB. Qt's default of 10MB doesn't fit one photo, this fits a handful.
+PIXMAP_CACHE_LIMIT = 256 * 1024
+
+# The source image is set again every time the glitch is redone, this keeps it from being decoded each time.
+# The modified time is part of the key so the image is reloaded if the file changes.
+def file_pixmap(filename):
+    try:
+        key = f'{os.path.abspath(filename)}:{os.path.getmtime(filename)}'
+    except OSError:
+        key = None
+    pixmap = QPixmap()
+    if key and QPixmapCache.find(key, pixmap):
+        return pixmap
+    # Decoding into a QImage and converting it is faster than having QPixmap load the file itself
+    pixmap = QPixmap.fromImage(QImage(filename))
+    if key and not pixmap.isNull():
+        QPixmapCache.insert(key, pixmap)
+    return pixmap
 
 class ScrollableImageViewer(QWidget):
     def __init__(self, filename=None, metadata=None):
         super().__init__()
+        if QPixmapCache.cacheLimit() < PIXMAP_CACHE_LIMIT:
+            QPixmapCache.setCacheLimit(PIXMAP_CACHE_LIMIT)
         self.loadUI()
         self.scene_pixmap = None
         self.rb_rect = None
@@ -29,10 +58,19 @@ class ScrollableImageViewer(QWidget):
         max_zoom = 8.0
 
         self.scene = QGraphicsScene()
+        # The scene only ever has the pixmap and the selection rectangle in it, so keeping a BSP tree of the items costs more than it saves
+        self.scene.setItemIndexMethod(QGraphicsScene.NoIndex)
+        # The pixmap item stays in the scene for the life of the viewer, setImage only swaps its pixmap
+        self.pixmap_item = self.scene.addPixmap(QPixmap())
         self.view = ZoomableGraphicsView(1.0, min_zoom, max_zoom, self.scene)
         self.view.setTransformationAnchor(QGraphicsView.AnchorUnderMouse)
+        if QOpenGLWidget is not None:
+            # Draw the view with the GPU so zooming and panning a large image doesn't scale it on the CPU every frame.
+            # An OpenGL viewport redraws everything anyway and partial updates leave artifacts behind.
+            self.view.setViewport(QOpenGLWidget())
+            self.view.setViewportUpdateMode(QGraphicsView.FullViewportUpdate)
         self.view.setSizePolicy(QSizePolicy(QSizePolicy.MinimumExpanding, QSizePolicy.MinimumExpanding))
-        self.view.rubberBandChanged.connect(self.selectionChanged)
+        self.view.selectionFinalized.connect(self.selectionChanged)
         self.rb_pen = QPen(Qt.DashLine)
         self.rb_brush = QBrush(Qt.red, Qt.Dense4Pattern)
 
@@ -66,6 +104,12 @@ class ScrollableImageViewer(QWidget):
         self.layout.addWidget(self.view)
         self.layout.addLayout(self.info_bar)
 
+        # Dragging the window edge sends a resize event for every step, the view is only refit once it stops.
+        self.resize_timer = QTimer(self)
+        self.resize_timer.setSingleShot(True)
+        self.resize_timer.setInterval(50)
+        self.resize_timer.timeout.connect(self.applyResize)
+
     def setViewZoom(self):
         self.view.setZoom(self.zoom_slider.value() / 100)
 
@@ -76,30 +120,41 @@ class ScrollableImageViewer(QWidget):
         self.syncSlider(1.0)
         self.setViewZoom()
 
-    def setImage(self, filename, clear_selection=True):
-        self.scene.clear()
+    # image can be a filename or a QImage. label is shown in the info bar, it defaults to the filename.
+    def setImage(self, image, clear_selection=True, label=None):
         if clear_selection:
-            self.rb_rect = None
-            self.rb_graphicsitem = None
-        self.source_pixmap = QPixmap(filename) # I don't know why I have two pixmaps... it's old code.
+            self.deleteSelection()
+        if isinstance(image, QImage):
+            self.source_pixmap = QPixmap.fromImage(image)
+        else:
+            self.source_pixmap = file_pixmap(image) # I don't know why I have two pixmaps... it's old code.
+            label = label or image
         self.scene_pixmap = self.source_pixmap
         self.scene.setSceneRect(self.scene_pixmap.rect())
-        self.scene.addPixmap(self.scene_pixmap)
-        if self.rb_rect:
+        self.view.setPixmapItem(self.pixmap_item, self.pixmapPyramid(self.scene_pixmap))
+        if self.rb_rect and self.rb_graphicsitem is None:
             self.rb_graphicsitem = self.scene.addRect(self.rb_rect, self.rb_pen, self.rb_brush)
 
         image_size = self.source_pixmap.size()
-        self.image_info_label.setText(f'{filename} | {image_size.width()}x{image_size.height()}')
+        self.image_info_label.setText(f'{label} | {image_size.width()}x{image_size.height()}')
 
         self.resetView()
 
+    # Each level is half the size of the one before it, the first level is the full image
+    def pixmapPyramid(self, pixmap):
+        pyramid = [pixmap]
+        while min(pyramid[-1].width(), pyramid[-1].height()) > PYRAMID_MIN_SIZE:
+            level = pyramid[-1]
+            pyramid.append(level.scaled(level.width() // 2, level.height() // 2, Qt.IgnoreAspectRatio, Qt.SmoothTransformation))
+        return pyramid
+
     def resetView(self, center=True):
         if self.scene_pixmap is None:
             return None
         self.syncSlider(1.0)
         self.setViewZoom()
         self.view.fitInView(self.scene_pixmap.rect(), Qt.KeepAspectRatio)
-        self.view.centerOn(self.scene.items()[0])
+        self.view.centerOn(self.pixmap_item)
 
     def deleteSelection(self):
         self.rb_rect = None
@@ -122,38 +177,26 @@ class ScrollableImageViewer(QWidget):
         selection_rect = QRectF(self.rb_rect)
         self.rb_graphicsitem = self.scene.addRect(selection_rect, self.rb_pen, self.rb_brush)
 
-    # NOTE: When you let go of the mouse, like when you finish your selection,
-    #       it still triggers view.rubberBandChanged but with rect, start, and end containing 0s.
-    #       So interpret those values as meaning the rubber band will no longer change
-    #       and use the previous values as the final rect.
-    def selectionChanged(self, rb_rect, start, end):
+    # start and end are the scene coords where the mouse was pressed and released, see ZoomableGraphicsView.
+    def selectionChanged(self, start, end):
         if self.scene_pixmap is None:
             return None
-        # I really don't want false-positives here, though I probably don't need to check everything
-        rect_null = rb_rect.x() == 0.0 \
-                    and rb_rect.y() == 0.0 \
-                    and rb_rect.width() == 0.0 \
-                    and rb_rect.height() == 0.0
-
-        start_null = start.x() == 0.0 and start.y() == 0.0
-        end_null = end.x() == 0.0 and end.y() == 0.0
-        if rect_null and start_null and end_null:
-            if self.selection_moving:
-                self.drawSelectionBox()
-            self.selection_moving = False
-        else:
-            self.selection_moving = True
-            pixmap_rect = self.scene_pixmap.rect()
-            # If the rubber band was made from right to left, start will be the right coords and end will
-            # be left. In order to make these coords compatible with PIL you need to find which is which.
-            left = int(clamp(min(start.x(), end.x()), pixmap_rect.x(), pixmap_rect.width()))
-            top = int(clamp(min(start.y(), end.y()), pixmap_rect.y(), pixmap_rect.height()))
-            right = int(clamp(max(start.x(), end.x()), pixmap_rect.x(), pixmap_rect.width()))
-            bottom = int(clamp(max(start.y(), end.y()), pixmap_rect.y(), pixmap_rect.height()))
+        # If the rubber band was made from right to left, start will be the right coords and end will
+        # be left. normalized() swaps them so the rect can be used as PIL coords, and intersected() keeps it on the image.
+        selection_rect = QRect(QPoint(int(start.x()), int(start.y())), QPoint(int(end.x()), int(end.y()))).normalized()
+        selection_rect = selection_rect.intersected(self.scene_pixmap.rect())
+        if selection_rect.isEmpty():
+            # The whole selection was off the image
+            self.deleteSelection()
+            return None
 
-            self.rb_rect = QRect(QPoint(left, top), QPoint(right, bottom))
+        self.rb_rect = selection_rect
+        self.drawSelectionBox()
 
     def resizeEvent(self, event):
+        self.resize_timer.start()
+
+    def applyResize(self):
         # When the widget changes size I want to update the size of the image.
         # When the widget grows the image takes up the same relative space.
         zoom = self.zoom_slider.value() / 100
@@ -169,38 +212,106 @@ class ScrollableImageViewer(QWidget):
 
 
 
-# NOTE I don't know much about the QTransform matrix but it might be able to make the scaling simpler.
-# NOTE The GraphicsView.scale method scales relative to the current viewed size but my slider in ScrollableImageViewer
-#      displays the scale relative to the original image's size.
-#      Because of this I need to switch back and forth between relative and absolute scaling.
-#      That's why ZoomableGraphicsView has an additional property, zoom_level, which maintains the total product of
-#      every scale applied.
+# NOTE The slider in ScrollableImageViewer displays the zoom relative to the size the image has after fitInView.
+#      ZoomableGraphicsView keeps that scale in fit_scale and zoom_level is the zoom on top of it.
+#      Every zoom sets the whole transform from those two instead of scaling the current transform,
+#      so rounding errors don't build up as the user zooms in and out.
+# NOTE When the image is shown smaller than half its size the pixmap item is switched to a smaller copy from the pyramid
+#      and scaled back up by the item, so the scene (and the selection) still uses the coordinates of the full image.
 class ZoomableGraphicsView(QGraphicsView):
     zoomChanged = Signal(float) # Emits the new scaling factor relative to the original image size
+    selectionFinalized = Signal(QPointF, QPointF) # Emits the scene coords where a rubber band drag started and ended
 
     def __init__(self, zoom, min_zoom, max_zoom, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.zoom_level = zoom
         self.min_zoom = min_zoom
         self.max_zoom = max_zoom
+        self.fit_scale = 1.0
+        # The scene is one pixmap and a selection rectangle, both lined up with the pixels, so nothing needs antialiasing.
+        # Smooth pixmap scaling is kept so the pyramid levels don't look blocky.
+        self.setRenderHints(QPainter.SmoothPixmapTransform)
+        self.setOptimizationFlag(QGraphicsView.DontAdjustForAntialiasing, True)
+        self.setOptimizationFlag(QGraphicsView.DontSavePainterState, True)
+        self.pixmap_item = None
+        self.pyramid = []
+        self.selection_start = None
+
+        # Spinning the wheel sends lots of small events, they're multiplied together and applied at most once a frame
+        self.pending_zoom = 1.0
+        self.wheel_timer = QTimer(self)
+        self.wheel_timer.setSingleShot(True)
+        self.wheel_timer.setInterval(16)
+        self.wheel_timer.timeout.connect(self.applyWheelZoom)
+
+    def fitInView(self, *args, **kwargs):
+        # fitInView does nothing when the view has no size, the image is shown at its real size then
+        self.resetTransform()
+        super().fitInView(*args, **kwargs)
+        self.fit_scale = self.transform().m11()
+        self.zoom_level = 1.0
+        self.updatePixmapLevel()
+
+    def applyZoom(self, zoom):
+        scale = self.fit_scale * zoom
+        self.setTransform(QTransform.fromScale(scale, scale))
+        self.zoom_level = zoom
+        self.updatePixmapLevel()
+
+    def setPixmapItem(self, pixmap_item, pyramid):
+        self.pixmap_item = pixmap_item
+        self.pyramid = pyramid
+        self.pixmap_item.setPixmap(pyramid[0])
+        self.pixmap_item.resetTransform()
+        self.updatePixmapLevel()
+
+    def updatePixmapLevel(self):
+        if self.pixmap_item is None or len(self.pyramid) < 2:
+            return None
+        scale = self.transform().m11()
+        level = 0 if scale >= 1.0 else min(int(math.log2(1.0 / scale)), len(self.pyramid) - 1)
+        pixmap = self.pyramid[level]
+        if self.pixmap_item.pixmap().cacheKey() == pixmap.cacheKey():
+            return None
+        self.pixmap_item.setPixmap(pixmap)
+        full_size = self.pyramid[0]
+        self.pixmap_item.setTransform(QTransform.fromScale(full_size.width() / pixmap.width(), full_size.height() / pixmap.height()))
 
     def setZoom(self, new_zoom):
         # NOTE this returns zoom_level so the parent widget knows if the zoom was limited by min_zoom
-        new_zoom = min(self.max_zoom, max(new_zoom, self.min_zoom))
-        scale = (1.0 / self.zoom_level) * new_zoom
-        self.scale(scale, scale)
-        self.zoom_level = new_zoom
+        self.applyZoom(min(self.max_zoom, max(new_zoom, self.min_zoom)))
         return self.zoom_level
 
     def incrementZoom(self, zoom_delta):
-        if self.max_zoom < self.zoom_level * zoom_delta or self.zoom_level * zoom_delta < self.min_zoom:
-            return None
-        self.scale(zoom_delta, zoom_delta)
-        self.zoom_level *= zoom_delta
+        # setZoom clamps, so a step that goes past the limit still zooms up to it
+        self.setZoom(self.zoom_level * zoom_delta)
         self.zoomChanged.emit(self.zoom_level)
 
+    # The selection is only worked out once, when the mouse is released, instead of on every rubberBandChanged while dragging
+    def mousePressEvent(self, event):
+        if self.dragMode() == QGraphicsView.RubberBandDrag and event.button() == Qt.LeftButton:
+            self.selection_start = self.mapToScene(event.position().toPoint())
+        super().mousePressEvent(event)
+
+    def mouseReleaseEvent(self, event):
+        super().mouseReleaseEvent(event)
+        if self.selection_start is not None and event.button() == Qt.LeftButton:
+            start = self.selection_start
+            end = self.mapToScene(event.position().toPoint())
+            self.selection_start = None
+            # A click without dragging doesn't select anything
+            if start != end:
+                self.selectionFinalized.emit(start, end)
+
     def wheelEvent(self, event):
         zoom_delta = 1.0 + (event.angleDelta().y() / 8.0 / 360.0)
+        self.pending_zoom *= zoom_delta
+        if not self.wheel_timer.isActive():
+            self.wheel_timer.start()
+
+    def applyWheelZoom(self):
+        zoom_delta = self.pending_zoom
+        self.pending_zoom = 1.0
         self.incrementZoom(zoom_delta)
 
 
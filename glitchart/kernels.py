@@ -0,0 +1,253 @@
+""" kernels - compiled loops used by the glitch functions. They take numpy arrays and are compiled with numba if it is installed. """
+# Copyright (c) 2021 Mark Schloeman
+
+import numpy as np
+
+try:
+    from numba import njit, prange
+    compiled = True
+except ImportError:
+    # numba is optional. Without it these are plain python functions, which still work on numpy arrays, just slower.
+    compiled = False
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+    prange = range
+
+
+# Size of the square blocks the image is walked in by diagonal_lines.
+# 64x64 pixels of RGB is 12KB so a block fits in the L1 cache.
+DIAGONAL_BLOCK_SIZE = 64
+
+
+# One signature per array shape so each compiled version knows the layout of the pixels.
+# uint8[:,:,::1] is for RGB / RGBA images and uint8[:,::1] is for single band images (L, P, or a split band).
+# cache=True saves the compiled code in __pycache__ so it is only compiled the first time the program runs.
+# parallel=True spreads the rows over every core, each row is only written by one thread.
+@njit(["void(uint8[:,:,::1], uint8[:,:,::1], int32[:], boolean)",
+       "void(uint8[:,::1], uint8[:,::1], int32[:], boolean)"], parallel=True, cache=True)
+def offset_lines(src, dst, offsets, wrap):
+    """ Offset each row of src by the matching value in offsets and write it to dst.
+    This has the same results as looping over groupby.rows in offset.offset.
+
+    :param src: a C-contiguous uint8 array with shape (lines, width) or (lines, width, channels).
+    :param dst: an array with the same shape as src.
+    :param offsets: an int32 array with one offset per line.
+    :param wrap: if False pixels are smeared at the edge instead of wrapping around.
+    """
+    width = src.shape[1]
+    for y in prange(src.shape[0]):
+        offset = offsets[y]
+        if offset < 0:
+            offset = -offset % width
+            dst[y, : width - offset] = src[y, offset :]
+            if wrap:
+                dst[y, width - offset :] = src[y, : offset]
+            else:
+                dst[y, width - offset :] = src[y, width - offset :]
+        elif wrap:
+            pivot = width - 1 - offset % width
+            dst[y, : width - pivot] = src[y, pivot :]
+            dst[y, width - pivot :] = src[y, : pivot]
+        else:
+            offset %= width
+            dst[y, : offset] = src[y, : offset]
+            dst[y, offset :] = src[y, : width - offset]
+
+
+@njit(cache=True)
+def diagonal_lines(src, dst, starts, flip_slope):
+    """ Copy the diagonals of an image into dst one after another, in the same order groupby.diagonals yields them.
+    Pixel (x, y) is on diagonal x - y + height - 1 (x + y when flipped) at index min(x, y) (min(x, height - 1 - y) when flipped).
+    Walking the diagonals directly jumps to a new row on every pixel, so the image is read a block at a time instead.
+
+    :param src: an array of pixels with shape (height, width) or (height, width, channels).
+    :param dst: an array with shape (height * width) or (height * width, channels).
+    :param starts: an int64 array with the index in dst where each diagonal starts, plus the end of the last one.
+    :param flip_slope: if True the lines go up and to the right.
+    """
+    height = src.shape[0]
+    width = src.shape[1]
+    for block_y in range(0, height, DIAGONAL_BLOCK_SIZE):
+        for block_x in range(0, width, DIAGONAL_BLOCK_SIZE):
+            for y in range(block_y, min(block_y + DIAGONAL_BLOCK_SIZE, height)):
+                if flip_slope:
+                    diagonal_y = height - 1 - y
+                else:
+                    diagonal_y = y
+                for x in range(block_x, min(block_x + DIAGONAL_BLOCK_SIZE, width)):
+                    dst[starts[x - diagonal_y + height - 1] + min(x, diagonal_y)] = src[y, x]
+
+
+# parallel=True runs the prange loops on every core. Each line is only written by one thread.
+# The keys are int16 for the keys that are whole numbers (brightness and single channels) and float64 for the rest.
+@njit(["void(uint8[:,::1], float64[::1], int64[::1], int64[::1], boolean)",
+       "void(uint8[::1], float64[::1], int64[::1], int64[::1], boolean)",
+       "void(uint8[:,::1], int16[::1], int64[::1], int64[::1], boolean)",
+       "void(uint8[::1], int16[::1], int64[::1], int64[::1], boolean)"], parallel=True, cache=True)
+def sort_lines(pixels, keys, starts, ends, reverse):
+    """ Sort each line of pixels in place by its keys. Line i is pixels[starts[i] : ends[i]], the lines can't overlap.
+    The sort is stable both ways, like python's sorted(), so it gives the same order as sorting the lines one at a time.
+
+    :param pixels: a uint8 array of pixels with shape (n) or (n, channels).
+    :param keys: a float64 or int16 array with the key of each pixel.
+    :param starts: an int64 array with the index where each line starts.
+    :param ends: an int64 array with the index where each line ends.
+    :param reverse: if True each line is sorted from the highest key to the lowest.
+    """
+    for i in prange(starts.shape[0]):
+        start = starts[i]
+        end = ends[i]
+        if reverse:
+            order = np.argsort(-keys[start : end], kind="mergesort")
+        else:
+            order = np.argsort(keys[start : end], kind="mergesort")
+        line = pixels[start : end].copy()
+        for j in range(end - start):
+            pixels[start + j] = line[order[j]]
+
+
+# The int16 keys only take a few hundred (or for brightness 1531) values, so a line with more pixels than that
+# can be counting sorted in one pass instead of being compared. Shorter lines are sorted like sort_lines does.
+@njit(["void(uint8[:,::1], int16[::1], int64[::1], int64[::1], boolean)",
+       "void(uint8[::1], int16[::1], int64[::1], int64[::1], boolean)"], parallel=True, cache=True)
+def count_sort_lines(pixels, keys, starts, ends, reverse):
+    """ Same as sort_lines but counting sorts the lines that have more pixels than different keys.
+
+    :param pixels: a uint8 array of pixels with shape (n) or (n, channels).
+    :param keys: an int16 array with the key of each pixel.
+    :param starts: an int64 array with the index where each line starts.
+    :param ends: an int64 array with the index where each line ends.
+    :param reverse: if True each line is sorted from the highest key to the lowest.
+    """
+    for i in prange(starts.shape[0]):
+        start = starts[i]
+        end = ends[i]
+        if end - start < 2:
+            continue
+        line_keys = keys[start : end]
+        line = pixels[start : end].copy()
+        low = line_keys.min()
+        high = line_keys.max()
+        if high - low >= end - start:
+            if reverse:
+                order = np.argsort(-line_keys, kind="mergesort")
+            else:
+                order = np.argsort(line_keys, kind="mergesort")
+            for j in range(end - start):
+                pixels[start + j] = line[order[j]]
+            continue
+        # Reversed lines count from the highest key down. Equal keys keep their order either way, like sorted().
+        positions = np.zeros(high - low + 1, dtype=np.int64)
+        for j in range(end - start):
+            if reverse:
+                positions[high - line_keys[j]] += 1
+            else:
+                positions[line_keys[j] - low] += 1
+        position = start
+        for bucket in range(positions.shape[0]):
+            count = positions[bucket]
+            positions[bucket] = position
+            position += count
+        for j in range(end - start):
+            if reverse:
+                bucket = high - line_keys[j]
+            else:
+                bucket = line_keys[j] - low
+            pixels[positions[bucket]] = line[j]
+            positions[bucket] += 1
+
+
+def line_sorter(keys):
+    """ Get the kernel to sort lines with these keys.
+    Without numba counting sort is a python loop, so numpy's argsort in sort_lines is faster.
+
+    :param keys: the array of keys from pixelsort.key_array.
+    :returns: count_sort_lines or sort_lines.
+    """
+    if compiled and keys.dtype == np.int16:
+        return count_sort_lines
+    return sort_lines
+
+
+@njit(parallel=True, cache=True)
+def brightness_keys(pixels):
+    """ pixelstats.brightness_fast_key for every pixel in one pass, without the temporary arrays numpy needs.
+
+    :param pixels: a uint8 array of pixels with shape (n, channels), the first three channels are red, green, and blue.
+    :returns: an int16 array with 2 * red + 3 * green + blue for each pixel.
+    """
+    keys = np.empty(pixels.shape[0], dtype=np.int16)
+    for i in prange(pixels.shape[0]):
+        keys[i] = 2 * pixels[i, 0] + 3 * pixels[i, 1] + pixels[i, 2]
+    return keys
+
+
+@njit("void(int16[::1], int64[::1], int64, int64, float64, boolean[::1])", parallel=True, cache=True)
+def tracer_lines(variance_metric, starts, tracer_length, border_width, variance_threshold, is_tracer_start):
+    """ Find the tracers in every line at once. This gives the same tracers as running groupby.tracers on each line.
+    Line i is variance_metric[starts[i] : starts[i + 1]].
+
+    :param variance_metric: an int16 array with the brightness of each pixel.
+    :param starts: an int64 array with the index where each line starts, plus the end of the last one.
+    :param tracer_length: how many pixels are in each tracer.
+    :param border_width: how many pixels need to satisfy the border condition.
+    :param variance_threshold: the difference in brightness needed for a border.
+    :param is_tracer_start: a boolean array the length of variance_metric, set to True where a tracer starts.
+    """
+    for i in prange(starts.shape[0] - 1):
+        end = starts[i + 1]
+        x = starts[i]
+        while x < end - border_width:
+            at_border = True
+            for offset in range(1, border_width):
+                if abs(variance_metric[x] - variance_metric[x + offset]) < variance_threshold:
+                    at_border = False
+                    break
+            if at_border:
+                is_tracer_start[x] = True
+                x += tracer_length
+            else:
+                x += 1
+
+
+@njit("int64(boolean[::1], int64, int64[::1])", cache=True)
+def tracer_starts(at_border, tracer_length, starts):
+    """ Walk the border mask from groupby.tracers and find where each tracer starts.
+    Every border starts a tracer and borders inside a tracer are skipped.
+
+    :param at_border: a boolean array that is True for each pixel at a border.
+    :param tracer_length: how many pixels are in each tracer.
+    :param starts: an int64 array at least as long as at_border. The start of each tracer is written to it.
+    :returns: the number of tracers, starts[:count] is filled in.
+    """
+    count = 0
+    x = 0
+    while x < at_border.shape[0]:
+        if at_border[x]:
+            starts[count] = x
+            count += 1
+            x += tracer_length
+        else:
+            x += 1
+    return count
+
+
+def warm_up():
+    """ Compile the kernels that don't have signatures by running them on tiny arrays.
+    diagonal_lines and brightness_keys are compiled when they're first called because they take a few pixel types
+    and the pixels can be read-only (pixelsort wraps Pillow's buffer with np.asarray), this makes that happen ahead of time.
+    With cache=True it only really compiles the first time the program runs.
+    """
+    starts = np.array([0, 1, 2, 3, 4], dtype=np.int64)
+    starts.flags.writeable = False
+    # RGB images, single bands and the int64 indices used by offset
+    for src in (np.zeros((2, 2, 3), dtype=np.uint8), np.zeros((2, 2), dtype=np.uint8), np.zeros((2, 2), dtype=np.int64)):
+        for writeable in (True, False):
+            src.flags.writeable = writeable
+            diagonal_lines(src, np.empty_like(src.reshape(4, *src.shape[2:])), starts, False)
+    pixels = np.zeros((2, 3), dtype=np.uint8)
+    for writeable in (True, False):
+        pixels.flags.writeable = writeable
+        brightness_keys(pixels)
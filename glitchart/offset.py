@@ -1,10 +1,13 @@
 """ offset - Rotate or offset lines in an image """
 
 import math
+import functools
 
+import numpy as np
 import pixelsort
 from PIL import Image
 import groupby
+import util
 
 def blend(px_a, px_b, alpha):
     """ Blends two pixels so the result pixel is alpha% pixel_b """
@@ -12,6 +15,17 @@ def blend(px_a, px_b, alpha):
         return min(int(px_a * (1.0 - alpha) + px_b * alpha), 255)
     return tuple([blend(a, b, alpha) for a, b in zip(px_a, px_b)])
 
+def blend_arrays(pixels_a, pixels_b, alpha):
+    """ Blend two integer arrays of pixels. This gives the same values as calling blend on each pair of pixels.
+
+    :param pixels_a: an integer numpy array (uint8 or the 16 and 32 bit "I" modes).
+    :param pixels_b: a numpy array with the same shape and dtype as pixels_a.
+    :param alpha: a float, how much of pixels_b is in the result.
+    :returns: a new numpy array with the dtype of pixels_a.
+    """
+    blended = pixels_a * (1.0 - alpha) + pixels_b * alpha
+    return np.minimum(blended.astype(np.int64), 255).astype(pixels_a.dtype)
+
 # Offset Helper Functions
 # It feels wasteful to have functions that just return numbers but it keeps the code simpler... I think
 def static_number(line_number, offset, **kwargs):
@@ -26,110 +40,239 @@ def sine(line_number, height, inv_wavelength, **kwargs):
 def cosine(line_number, height, inv_wavelength, **kwargs):
     return int(height * math.cos(line_number * inv_wavelength * math.pi / 2))
 
-def offset(source, line_generator, offset_function, coords=None, wrap=True, **kwargs):
-    """ Run an image through a line generator (from groupby.py) and rotate the lines
+# Versions of the offset functions that take a numpy array of line numbers and return an array of offsets.
+# They give the same offsets as calling the functions above once per line.
+def static_number_vec(line_numbers, offset, **kwargs):
+    return np.full(len(line_numbers), offset)
+
+def line_number_vec(line_numbers, **kwargs):
+    return line_numbers
+
+def sine_vec(line_numbers, height, inv_wavelength, **kwargs):
+    # astype truncates toward zero like int() does
+    return (height * np.sin(line_numbers * inv_wavelength * math.pi / 2)).astype(np.int64)
+
+def cosine_vec(line_numbers, height, inv_wavelength, **kwargs):
+    return (height * np.cos(line_numbers * inv_wavelength * math.pi / 2)).astype(np.int64)
+
+vector_offset_functions = {static_number: static_number_vec, line_number: line_number_vec, sine: sine_vec, cosine: cosine_vec}
+
+def line_offsets(offset_function, line_count, **kwargs):
+    """ Get the offset of every line at once.
+
+    :param offset_function: a function that takes two ints and is used to determine the offset.
+    :param line_count: how many lines there are.
+    :returns: an int32 numpy array with the offset of each line.
+    """
+    vector_function = vector_offset_functions.get(offset_function)
+    if vector_function:
+        return np.asarray(vector_function(np.arange(line_count), **kwargs), dtype=np.int32)
+    # The kwargs are bound once instead of being unpacked for every line
+    line_offset = functools.partial(offset_function, **kwargs)
+    return np.array([line_offset(line_number) for line_number in range(line_count)], dtype=np.int32)
+
+def static_shift(length, offset):
+    """ Work out how far the pixels of a line move when it is offset with wrap, as a shift for numpy.roll.
+
+    :param length: how many pixels are in the line.
+    :param offset: an int, negative offsets move pixels to the left.
+    :returns: an int.
+    """
+    if offset < 0:
+        return -(abs(offset) % length)
+    # NOTE positive offsets wrap one pixel further than negative ones, this matches line_segments.
+    return offset % length + 1
+
+def line_segments(length, offset, wrap=True):
+    """ Work out which parts of a line go where when it is offset.
+    With wrap the line is rotated, pixels pushed off one end come back at the other. A negative offset moves the
+    pixels left by offset, a positive one moves them right by offset + 1.
+    Without wrap the pixels move by offset and the end of the line they move away from keeps its original pixels.
+
+    :param length: how many pixels are in the line.
+    :param offset: an int, negative offsets move pixels to the left.
+    :param wrap: if False the pixels pushed off the end are dropped instead of wrapping around.
+    :returns: a list of (source start, source end, destination start) tuples.
+    """
+    if offset < 0:
+        offset = abs(offset) % length
+        if wrap:
+            segments = [(offset, length, 0), (0, offset, length - offset)]
+        else:
+            segments = [(offset, length, 0), (length - offset, length, length - offset)]
+    elif wrap:
+        pivot = length - 1 - offset % length
+        segments = [(pivot, length, 0), (0, pivot, length - pivot)]
+    else:
+        offset %= length
+        segments = [(0, offset, 0), (0, length - offset, offset)]
+    return [segment for segment in segments if segment[0] < segment[1]]
+
+def offset_image_lines(image, line_generator, offset_function, wrap=True, **kwargs):
+    """ Offset the rows or columns of an image in place by cropping and pasting each part of the line.
+    This is for the modes that can't be offset as a uint8 array, the copying is all done by PIL.
+
+    :param image: a PIL Image.
+    :param line_generator: groupby.rows or groupby.columns.
+    :param offset_function: a function that takes two ints and is used to determine the offset.
+    """
+    source = image.copy()
+    width, height = image.size
+    if line_generator is groupby.columns:
+        for x, offset in enumerate(line_offsets(offset_function, width, **kwargs)):
+            for start, end, destination in line_segments(height, int(offset), wrap):
+                image.paste(source.crop((x, start, x + 1, end)), (x, destination))
+    else:
+        for y, offset in enumerate(line_offsets(offset_function, height, **kwargs)):
+            for start, end, destination in line_segments(width, int(offset), wrap):
+                image.paste(source.crop((start, y, end, y + 1)), (destination, y))
+
+def offset_indices(line_generator, offset_function, size, wrap=True, **kwargs):
+    """ Run the pixel indices of an image through a line generator and offset the lines.
+    This works out where every pixel goes without touching the pixels themselves.
 
-    :param source: a string containing path to an image or a PIL Image object
     :param line_generator: a generator from groupby.py used to delineate an image (linear, rows, columns, etc.)
     :param offset_function: a function that takes two ints and is used to determine the offset.
-    :returns: a PIL Image
+    :param size: the image's (width, height).
+    :returns: an int numpy array where result pixel i is source pixel indices[i].
+    """
+    lines = list(line_generator(np.arange(size[0] * size[1]), size, **kwargs))
+    offsets = line_offsets(offset_function, len(lines), **kwargs)
+    # Each part of a line is written straight to its place in indices instead of building every offset line and joining them
+    indices = np.empty(sum(len(line) for line in lines), dtype=np.intp)
+    line_start = 0
+    for line, offset in zip(lines, offsets):
+        for start, end, destination in line_segments(len(line), int(offset), wrap):
+            indices[line_start + destination : line_start + destination + end - start] = line[start : end]
+        line_start += len(line)
+
+    transposer = groupby.group_transpose_generators.get(line_generator)
+    if transposer:
+        indices = transposer(indices, size, **kwargs)
+    return np.array(indices, dtype=np.intp)
+
+def offset_array(pixel_array, line_generator, offset_function, wrap=True, **kwargs):
+    """ Offset the rows or columns of an image array with kernels.offset_lines.
+
+    :param pixel_array: a uint8 numpy array with shape (height, width) or (height, width, channels).
+    :param line_generator: groupby.rows or groupby.columns.
+    :param offset_function: a function that takes two ints and is used to determine the offset.
+    :returns: a new numpy array with the same shape as pixel_array.
     """
-    if isinstance(source, str):
-        source = Image.open(source)
+    if offset_function is static_number and wrap:
+        # Every line moves the same amount, so the whole image is rolled at once
+        axis = 0 if line_generator is groupby.columns else 1
+        return np.roll(pixel_array, static_shift(pixel_array.shape[axis], kwargs["offset"]), axis=axis)
+    import kernels # Imported here so numba is only loaded (and the kernels compiled) when they are first used
+    # Columns are offset as the rows of the transposed image
+    if line_generator is groupby.columns:
+        pixel_array = pixel_array.swapaxes(0, 1)
+    src = np.ascontiguousarray(pixel_array)
+    offsets = line_offsets(offset_function, src.shape[0], **kwargs)
+    dst = np.empty_like(src)
+    kernels.offset_lines(src, dst, offsets, wrap)
+    if line_generator is groupby.columns:
+        dst = dst.swapaxes(0, 1)
+    return dst
+
+def offset_pixel_array(pixel_array, line_generator, offset_function, wrap=True, **kwargs):
+    """ Offset the lines of an image array.
+    Rows and columns go through the compiled kernel, the other line generators are done with one numpy gather.
+
+    :param pixel_array: a uint8 numpy array with shape (height, width) or (height, width, channels).
+    :param line_generator: a generator from groupby.py used to delineate an image (linear, rows, columns, etc.)
+    :param offset_function: a function that takes two ints and is used to determine the offset.
+    :returns: a new numpy array with the same shape as pixel_array.
+    """
+    if line_generator in (groupby.rows, groupby.columns):
+        return offset_array(pixel_array, line_generator, offset_function, wrap, **kwargs)
+    size = (pixel_array.shape[1], pixel_array.shape[0])
+    indices = offset_indices(line_generator, offset_function, size, wrap, **kwargs)
+    return pixel_array.reshape(len(indices), -1)[indices].reshape(pixel_array.shape)
+
+def resolve_functions(source, line_generator, offset_function):
+    """ Turn the arguments offset and offset_aura take as names into the image and functions they stand for.
+
+    :param source: a string containing path to an image or a PIL Image object
+    :param line_generator: a generator from groupby.py, its name, or a GroupKind
+    :param offset_function: a function from offset_functions or its name
+    :returns: a tuple (source, line_generator, offset_function)
+    """
+    source = util.open_image(source)
     if isinstance(line_generator, str):
         line_generator = groupby.group_generators.get(line_generator)
+    elif isinstance(line_generator, groupby.GroupKind):
+        line_generator = groupby.group_functions[line_generator]
     if isinstance(offset_function, str):
         offset_function = offset_functions.get(offset_function)
-    result = source.copy()
+    return source, line_generator, offset_function
+
+def offset(source, line_generator, offset_function, coords=None, wrap=True, **kwargs):
+    """ Run an image through a line generator (from groupby.py) and rotate the lines
+
+    :param source: a string containing path to an image or a PIL Image object
+    :param line_generator: a generator from groupby.py used to delineate an image (linear, rows, columns, etc.) or a GroupKind
+    :param offset_function: a function that takes two ints and is used to determine the offset.
+    :returns: a PIL Image
+    """
+    source, line_generator, offset_function = resolve_functions(source, line_generator, offset_function)
     if coords:
+        result = source.copy()
         glitch = result.crop(coords)
-        pixels = list(glitch.getdata())
     else:
-        glitch = result
-        pixels = list(glitch.getdata())
-    result_pixels = []
-    # Trying start and end to wave offsets don't wrap around the image
-    if wrap:
-        for line_number, line in enumerate(line_generator(pixels, glitch.size)):
-            offset = offset_function(line_number, **kwargs)
-            if offset < 0:
-                offset = abs(offset) % len(line)
-                result_pixels += line[offset :] + line[: offset]
-            else:
-                offset %= len(line)
-                pivot = len(line)  - 1 - offset
-                result_pixels += line[pivot :] + line[: pivot]
+        glitch = source
+    pixel_array = np.array(glitch)
+    if pixel_array.dtype != np.uint8 and line_generator in (groupby.rows, groupby.columns):
+        # Modes that don't use a byte per channel ("1", "I", "F") have their lines moved by PIL
+        if glitch is source:
+            glitch = source.copy()
+        offset_image_lines(glitch, line_generator, offset_function, wrap, **kwargs)
     else:
-        for line_number, line in enumerate(line_generator(pixels, glitch.size)):
-            offset = offset_function(line_number, **kwargs)
-            if offset < 0:
-                offset = abs(offset) % len(line)
-                pixels = line[offset :] + line[len(line) - offset : ]
-            else:
-                offset %= len(line)
-                pivot = len(line) - offset
-                pixels = line[: offset] + line[: pivot]
-            result_pixels += pixels
+        result_array = offset_pixel_array(pixel_array, line_generator, offset_function, wrap, **kwargs)
+        if glitch is source:
+            # Every pixel is written below, so there's no need to copy the source first
+            glitch = util.blank_image(source)
+        if pixel_array.dtype == np.uint8:
+            glitch.frombytes(np.ascontiguousarray(result_array).tobytes())
+        else:
+            # With the other line generators they're gathered like the byte modes.
+            # frombytes would need the pixels packed the way PIL stores that mode, fromarray does that.
+            glitch.paste(Image.fromarray(result_array))
 
-    transposer = groupby.group_transpose_generators.get(line_generator)
-    if transposer:
-        result_pixels = transposer(result_pixels, glitch.size, **kwargs)
-
-    glitch.putdata(result_pixels)
     if coords:
         result.paste(glitch, coords)
-    return result
+        return result
+    return glitch
 
 def offset_aura(source, line_generator, offset_function, coords=None, wrap=True, alpha=0.5, **kwargs):
     """ Use the offset mechanism to add an aura on top of the image """
-    if isinstance(source, str):
-        source = Image.open(source)
-    if isinstance(line_generator, str):
-        line_generator = groupby.group_generators.get(line_generator)
-    if isinstance(offset_function, str):
-        offset_function = offset_functions.get(offset_function)
+    source, line_generator, offset_function = resolve_functions(source, line_generator, offset_function)
     result = source.copy()
     if coords:
         glitch = result.crop(coords)
-        pixels = list(glitch.getdata())
     else:
         glitch = result
+    # The transposers undo their line generators, so blending the offset image with the original
+    # is the same as blending each offset line with the original line.
+    pixel_array = np.array(glitch)
+    if pixel_array.dtype.kind not in "iu":
+        # Mode "1" is a bool array but blend works with its 0 / 255 pixel values
         pixels = list(glitch.getdata())
-    result_pixels = []
-    # Trying start and end to wave offsets don't wrap around the image
-    if wrap:
-        for line_number, line in enumerate(line_generator(pixels, glitch.size)):
-            offset = offset_function(line_number, **kwargs)
-            if offset < 0:
-                offset = abs(offset) % len(line)
-                offset_pixels = line[offset :] + line[: offset]
-                mix_pixels = [blend(original_pixel, offset_pixel, alpha) for original_pixel, offset_pixel in zip(line, offset_pixels)]
-                result_pixels += mix_pixels
-            else:
-                offset %= len(line)
-                pivot = len(line)  - 1 - offset
-                offset_pixels = line[pivot :] + line[: pivot]
-                mix_pixels = [blend(original_pixel, offset_pixel, alpha) for original_pixel, offset_pixel in zip(line, offset_pixels)]
-                result_pixels += mix_pixels
+        offset_pixels = [pixels[i] for i in offset_indices(line_generator, offset_function, glitch.size, wrap, **kwargs)]
+        glitch.putdata([blend(original_pixel, offset_pixel, alpha) for original_pixel, offset_pixel in zip(pixels, offset_pixels)])
     else:
-        for line_number, line in enumerate(line_generator(pixels, glitch.size)):
-            offset = offset_function(line_number, **kwargs)
-            if offset < 0:
-                offset = abs(offset) % len(line)
-                offset_pixels = line[offset :] + line[len(line) - offset : ]
-                pixels = [blend(original_pixel, offset_pixel, alpha) for original_pixel, offset_pixel in zip(line, offset_pixels)]
-            else:
-                offset %= len(line)
-                pivot = len(line) - offset
-                offset_pixels = line[: offset] + line[: pivot]
-                pixels = [blend(original_pixel, offset_pixel, alpha) for original_pixel, offset_pixel in zip(line, offset_pixels)]
-            result_pixels += pixels
-
-    transposer = groupby.group_transpose_generators.get(line_generator)
-    if transposer:
-        result_pixels = transposer(result_pixels, glitch.size, **kwargs)
-
-    glitch.putdata(result_pixels)
+        if pixel_array.dtype != np.uint8 and line_generator in (groupby.rows, groupby.columns):
+            # Like offset(), the "I" modes have their rows and columns moved by PIL
+            offset_image = glitch.copy()
+            offset_image_lines(offset_image, line_generator, offset_function, wrap, **kwargs)
+            offset_pixels = np.array(offset_image)
+        else:
+            offset_pixels = offset_pixel_array(pixel_array, line_generator, offset_function, wrap, **kwargs)
+        blended = blend_arrays(pixel_array, offset_pixels, alpha)
+        if pixel_array.dtype == np.uint8:
+            glitch.frombytes(blended.tobytes())
+        else:
+            glitch.paste(Image.fromarray(blended))
     if coords:
         result.paste(glitch, coords)
     return result
@@ -3,8 +3,10 @@
 
 import os
 import sys
+import functools
 from colorsys import rgb_to_hsv
 
+import numpy as np
 from PIL import Image
 
 from groupby import *
@@ -22,47 +24,292 @@ def brighten(pixel, modifiers):
     """
 
     if isinstance(pixel, int):
-        return int(pixel * modifiers)
+        return min(255, int(pixel * modifiers))
     return tuple([min(255, int(color * modifier)) for color, modifier in zip(pixel, modifiers)])
 
+def brighten_array(pixels, modifiers):
+    """ brighten for a numpy array of pixels.
+
+    :param pixels: a numpy array of pixels with shape (n, channels), or (n) for a band.
+    :param modifiers: a tuple containing a value for each channel or a number for a band.
+    :returns: a numpy array of modified pixels with the same dtype. If modifiers are all 1 it is pixels.
+    """
+
+    if all(modifier == 1 for modifier in np.ravel(modifiers)):
+        return pixels
+    return np.minimum(255, (pixels * np.asarray(modifiers)).astype(np.int64)).astype(pixels.dtype)
+
 
 def sort_pixels(pixels, size, group_func, sort_func, key_func, reverse=False, color_mods=(1, 1, 1), **kwargs):
     """ Lowest level function that is used to perform a pixel sort.
     The reason this is separate from the sort_image function is so it can sort bands as well. I think it'll keep things more organized.
-    Note: when sorting bands the key_func should really just be a function or lambda that immediately returns the value passed to it.
+    Note: when sorting bands the key_func should be None so the values are compared directly.
 
-    :param pixels:     a 1 dimensional list of pixels from a Pillow Image or Band object
+    :param pixels:     a numpy array of pixels from a Pillow Image (width * height, channels) or Band object (width * height)
     :param size:       a list containing width and height of the overall image
     :param group_func: a function or generator
     :param sort_func:  a function or generator
-    :param key_func:   a function that is used as the key in python's sorted() function
+    :param key_func:   a function that is used as the key in python's sorted() function, or None to sort the values themselves
     :param reverse:    boolean used to reverse the sort order
-    :param color_mods: tuple of numbers used to modify sorted pixels
+    :param color_mods: tuple of numbers used to modify sorted pixels, channels past the end of it aren't modified
     :param kwargs:     any keyword arguments that will be passed to the sort_func and/or the group_func.
 
-    :returns: a list of sorted pixels.
+    :returns: a numpy array of sorted pixels with the same shape as pixels.
     """
 
-    sorted_pixels = []
+    # Channels without a modifier (alpha, the K of CMYK) are kept as they are, so RGBA and CMYK images
+    # can use the default (1, 1, 1) and still take the numpy paths below.
+    if pixels.ndim == 2 and np.ndim(color_mods) == 1 and len(color_mods) < pixels.shape[1]:
+        color_mods = tuple(color_mods) + (1,) * (pixels.shape[1] - len(color_mods))
+
+    # Sorting columns is the same as sorting the rows of the transposed image.
+    # Two transposes are cheaper than slicing out every column and putting them back with columns_fix.
+    if group_func is columns:
+        width, height = size
+        channels = pixels.shape[1:]
+        column_pixels = np.ascontiguousarray(pixels.reshape(height, width, *channels).swapaxes(0, 1))
+        sorted_columns = sort_pixels(column_pixels.reshape(pixels.shape), (height, width), rows, sort_func, key_func, reverse, color_mods, **kwargs)
+        return np.ascontiguousarray(sorted_columns.reshape(width, height, *channels).swapaxes(0, 1)).reshape(pixels.shape)
+
+    # Keys that work on arrays can be sorted with numpy instead of sorted().
+    # Without a key (for bands) the pixel values are the keys.
+    if key_func is None and pixels.ndim == 1:
+        vector_key = np.asarray
+    elif pixels.ndim == 2:
+        vector_key = vector_key_functions.get(key_func, None)
+    else:
+        vector_key = None
+    if vector_key is not None and np.shape(color_mods) == pixels.shape[1:]:
+        # When every line is sorted as a whole the sorting is done in one compiled pass
+        if sort_func is linear_sort and pixels.dtype == np.uint8:
+            return sort_whole_lines(pixels, size, group_func, vector_key, reverse, color_mods, **kwargs)
+        if sort_func is tracers and pixels.dtype == np.uint8:
+            return sort_tracer_lines(pixels, size, group_func, vector_key, reverse, color_mods, **kwargs)
+        return sort_groups(pixels, size, group_func, sort_func, vector_key, reverse, color_mods, **kwargs)
+
+    # The kwargs are bound once instead of being unpacked again for every line
+    sort_line = functools.partial(sort_func, **kwargs)
+    # Each group is written straight into the result instead of adding it onto one long list
+    sorted_pixels = np.empty_like(pixels)
+    group_start = 0
     for pixel_list in group_func(pixels, size, **kwargs):
-        for sorting_group, sort_flag in sort_func(pixel_list, **kwargs):
+        # The sort functions and key functions work with python ints / lists
+        for sorting_group, sort_flag in sort_line(np.asarray(pixel_list).tolist()):
+            if not sorting_group:
+                continue
+            group_end = group_start + len(sorting_group)
+            if sort_flag:
+                sorted_pixels[group_start : group_end] = [brighten(pixel, color_mods)
+                                                          for pixel in sorted(sorting_group,
+                                                                              key=key_func,
+                                                                              reverse=reverse)]
+            else:
+                sorted_pixels[group_start : group_end] = sorting_group
+            group_start = group_end
+    # Some sort functions (tracers_wobbly) drop pixels, the end of the image is left as it was
+    sorted_pixels[group_start :] = pixels[group_start :]
+    transpose_function = group_transpose_generators.get(group_func, None)
+    if transpose_function is not None:
+        sorted_pixels = transpose_function(sorted_pixels, size, **kwargs)
+    return np.ascontiguousarray(sorted_pixels).reshape(pixels.shape)
+
+def key_array(vector_key, pixels):
+    """ Get the sort keys of pixels in one of the types kernels.sort_lines takes.
+
+    :param vector_key: a function from pixelstats.vector_key_functions.
+    :param pixels:     a numpy array of pixels with shape (n, channels).
+    :returns: a contiguous numpy array of keys, int16 if the keys are bytes or int16 and float64 otherwise.
+    """
+
+    keys = np.asarray(vector_key(pixels))
+    # Whole number keys (brightness and single channels) stay small so they take less memory to sort
+    if keys.dtype in (np.uint8, np.int16):
+        return np.ascontiguousarray(keys, dtype=np.int16)
+    return np.ascontiguousarray(keys, dtype=np.float64)
+
+def concatenate_lines(pixels, size, group_func, **kwargs):
+    """ Put all of the lines from group_func one after another in a new array.
+
+    :param pixels:     a numpy array of pixels.
+    :param size:       a list containing width and height of the overall image
+    :param group_func: a function or generator
+    :param kwargs:     any keyword arguments that will be passed to the group_func.
+
+    :returns: a tuple (line_pixels, starts). Line i is line_pixels[starts[i] : starts[i + 1]].
+    """
+
+    lines = [np.asarray(line) for line in group_func(pixels, size, **kwargs)]
+    starts = np.zeros(len(lines) + 1, dtype=np.int64)
+    np.cumsum([len(line) for line in lines], out=starts[1:])
+    if not lines:
+        # An empty region has no lines to concatenate
+        return pixels[:0].copy(), starts
+    return np.concatenate(lines), starts
+
+def sort_whole_lines(pixels, size, group_func, vector_key, reverse=False, color_mods=(1, 1, 1), **kwargs):
+    """ Sort every line from group_func at once with the compiled kernels. Gives the same result as sort_pixels with linear_sort.
+
+    :param pixels:     a uint8 numpy array of pixels with shape (width * height, channels).
+    :param size:       a list containing width and height of the overall image
+    :param group_func: a function or generator
+    :param vector_key: a function from pixelstats.vector_key_functions.
+    :param reverse:    boolean used to reverse the sort order
+    :param color_mods: tuple of numbers used to modify sorted pixels
+    :param kwargs:     any keyword arguments that will be passed to the group_func.
+
+    :returns: a numpy array of sorted pixels with the same shape as pixels.
+    """
+
+    import kernels
+    import gpu
+    line_pixels, starts = concatenate_lines(pixels, size, group_func, **kwargs)
+    keys = key_array(vector_key, line_pixels)
+    line_lengths = np.diff(starts)
+    # The GPU sorts all of the lines as one 2d array so they have to be the same length (not diagonals or tiles)
+    # A region with no pixels has no lines (or empty ones) and falls through to the kernels, which handle that
+    if gpu.available and len(line_lengths) and line_lengths[0] > 0 and (line_lengths == line_lengths[0]).all():
+        line_pixels = gpu.sort_lines(line_pixels, keys, int(line_lengths[0]), bool(reverse))
+    else:
+        kernels.line_sorter(keys)(line_pixels, keys, starts[:-1], starts[1:], bool(reverse))
+    line_pixels = brighten_array(line_pixels, color_mods)
+    transpose_function = group_transpose_generators.get(group_func, None)
+    if transpose_function is not None:
+        line_pixels = transpose_function(line_pixels, size, **kwargs)
+    return np.ascontiguousarray(line_pixels).reshape(pixels.shape)
+
+def sort_tracer_lines(pixels, size, group_func, vector_key, reverse=False, color_mods=(1, 1, 1), **kwargs):
+    """ Find and sort the tracers in every line from group_func at once. Gives the same result as sort_pixels with tracers.
+
+    :param pixels:     a uint8 numpy array of pixels with shape (width * height, channels).
+    :param size:       a list containing width and height of the overall image
+    :param group_func: a function or generator
+    :param vector_key: a function from pixelstats.vector_key_functions.
+    :param reverse:    boolean used to reverse the sort order
+    :param color_mods: tuple of numbers used to modify sorted pixels
+    :param kwargs:     any keyword arguments that will be passed to tracers and/or the group_func.
+
+    :returns: a numpy array of sorted pixels with the same shape as pixels.
+    """
+
+    import kernels
+    line_pixels, starts = concatenate_lines(pixels, size, group_func, **kwargs)
+    # Same defaults as groupby.tracers
+    tracer_length = kwargs.get("tracer_length", 44)
+    variance_metric, brightness_range = tracer_brightness[line_pixels.ndim](line_pixels)
+    variance_threshold = (kwargs.get("variance_threshold") or 0.25) * brightness_range
+    is_tracer_start = np.zeros(len(line_pixels), dtype=np.bool_)
+    kernels.tracer_lines(variance_metric, starts, tracer_length, kwargs.get("border_width", 2), variance_threshold, is_tracer_start)
+    # A tracer stops at the end of its line
+    tracer_starts = np.flatnonzero(is_tracer_start).astype(np.int64)
+    tracer_ends = np.minimum(tracer_starts + tracer_length, starts[np.searchsorted(starts, tracer_starts, side="right")])
+    keys = key_array(vector_key, line_pixels)
+    kernels.line_sorter(keys)(line_pixels, keys, tracer_starts, tracer_ends, bool(reverse))
+    # Only the tracers are brightened
+    coverage = np.zeros(len(line_pixels) + 1, dtype=np.int64)
+    coverage[tracer_starts] += 1
+    coverage[tracer_ends] -= 1
+    in_tracer = np.cumsum(coverage[:-1]) > 0
+    line_pixels[in_tracer] = brighten_array(line_pixels[in_tracer], color_mods)
+    transpose_function = group_transpose_generators.get(group_func, None)
+    if transpose_function is not None:
+        line_pixels = transpose_function(line_pixels, size, **kwargs)
+    return np.ascontiguousarray(line_pixels).reshape(pixels.shape)
+
+def sort_groups(pixels, size, group_func, sort_func, vector_key, reverse=False, color_mods=(1, 1, 1), **kwargs):
+    """ Sort the groups from sort_func with a stable argsort of their keys. Gives the same result as sort_pixels.
+
+    :param pixels:     a numpy array of pixels with shape (width * height, channels).
+    :param size:       a list containing width and height of the overall image
+    :param group_func: a function or generator
+    :param sort_func:  a function or generator
+    :param vector_key: a function from pixelstats.vector_key_functions.
+    :param reverse:    boolean used to reverse the sort order
+    :param color_mods: tuple of numbers used to modify sorted pixels
+    :param kwargs:     any keyword arguments that will be passed to the sort_func and/or the group_func.
+
+    :returns: a numpy array of sorted pixels with the same shape as pixels.
+    """
+
+    # Each group is written straight into the result, groups that aren't sorted are only copied
+    sort_line = functools.partial(sort_func, **kwargs)
+    sorted_pixels = np.empty_like(pixels)
+    group_start = 0
+    for pixel_line in group_func(pixels, size, **kwargs):
+        for sorting_group, sort_flag in sort_line(np.asarray(pixel_line)):
+            sorting_group = np.asarray(sorting_group, dtype=pixels.dtype).reshape(-1, *pixels.shape[1:])
+            group_end = group_start + len(sorting_group)
             if sort_flag:
-                sorted_pixels += [brighten(pixel, color_mods)
-                                 for pixel in sorted(sorting_group,
-                                                     key=key_func,
-                                                     reverse=reverse)]
+                keys = key_array(vector_key, sorting_group)
+                # A stable sort of the negative keys keeps equal pixels in order, the same as sorted(reverse=True)
+                order = np.argsort(-keys if reverse else keys, kind="stable")
+                sorted_pixels[group_start : group_end] = brighten_array(sorting_group[order], color_mods)
             else:
-                sorted_pixels += sorting_group
+                sorted_pixels[group_start : group_end] = sorting_group
+            group_start = group_end
+    # Some sort functions (tracers_wobbly) drop pixels, the end of the image is left as it was
+    sorted_pixels[group_start :] = pixels[group_start :]
     transpose_function = group_transpose_generators.get(group_func, None)
     if transpose_function is not None:
-        sorted_pixels = group_transpose_generators[group_func](sorted_pixels, size, **kwargs)
-    return sorted_pixels
+        sorted_pixels = transpose_function(sorted_pixels, size, **kwargs)
+    return np.ascontiguousarray(sorted_pixels).reshape(pixels.shape)
+
+def image_pixels(img):
+    """ Get the pixels of a Pillow Image as a numpy array with the shape sort_pixels expects.
+
+    :param img: a Pillow Image object.
+    :returns: a numpy array with the shape (width * height) for single band images or (width * height, channels).
+    """
+
+    pixel_array = np.array(img)
+    return pixel_array.reshape(img.size[0] * img.size[1], *pixel_array.shape[2:])
+
+def region_pixels(img, coords=None):
+    """ Get the pixels of a Pillow Image, or the part of it inside coords, with the shape sort_pixels expects.
+
+    :param img:    a Pillow Image object.
+    :param coords: a tuple containing coordinates (left, upper, right, lower) like PIL.Image.crop() or None for the whole image.
+    :returns: a numpy array with the shape (width * height) for single band images or (width * height, channels).
+    """
+
+    if coords:
+        left, upper, right, lower = coords
+        # Coords that go past the edge of the image are padded by crop, so they're left to it
+        if not (0 <= left <= right <= img.size[0] and 0 <= upper <= lower <= img.size[1]):
+            return image_pixels(img.crop(coords))
+    # np.asarray wraps the bytes Pillow hands over instead of copying them again. It's read-only, sort_pixels doesn't write to it.
+    pixel_array = np.asarray(img)
+    if coords:
+        pixel_array = pixel_array[upper : lower, left : right]
+    return np.ascontiguousarray(pixel_array).reshape(-1, *pixel_array.shape[2:])
+
+def resolve_functions(src, grouping_function, sort_function, key_function):
+    """ Turn the arguments sort_image and sort_part take as names into the image and functions they stand for.
+    Arguments that already are an image or functions are returned as they are.
+
+    :param src:               a Pillow Image object OR a string indicating filepath to image.
+    :param grouping_function: a shaping function or generator OR a string that maps to a generator OR a GroupKind.
+    :param sort_function:     a sorting function or generator OR a string that maps to a generator.
+    :param key_function:      a function used as the key for sorted() OR a string that maps to one.
+
+    :returns: a tuple (src, grouping_function, sort_function, key_function).
+    """
+
+    src = open_image(src)
+    if isinstance(grouping_function, str):
+        grouping_function = group_generators[grouping_function]
+    elif isinstance(grouping_function, GroupKind):
+        grouping_function = group_functions[grouping_function]
+    if isinstance(sort_function, str):
+        sort_function = sort_generators.get(sort_function, linear_sort)
+    if isinstance(key_function, str):
+        key_function = key_functions[key_function]
+    return src, grouping_function, sort_function, key_function
 
 def sort_image(src, grouping_function, sort_function, key_function, reverse=False, color_mods=(1, 1, 1), coords=None, **kwargs):
     """ Function that sorts the pixels in an image.
 
     :param src:        a Pillow Image object to be sorted OR a string indicating filepath to image.
-    :param group_func: a shaping function or generator that OR a string that maps to a generator.
+    :param group_func: a shaping function or generator that OR a string that maps to a generator OR a GroupKind.
     :param sort_func:  a sorting function or generator OR a string that maps to a generator.
     :param key_func:   a function that is used as the key in python's sorted() function for pixels (tuples).
     :param reverse:    boolean used to reverse the sort order.
@@ -72,21 +319,15 @@ def sort_image(src, grouping_function, sort_function, key_function, reverse=Fals
     :returns:          a Pillow Image with the sorted pixels.
     """
 
-    if isinstance(src, str):
-        src = Image.open(src)
-    if isinstance(grouping_function, str):
-        grouping_function = group_generators[grouping_function]
-    if isinstance(sort_function, str):
-        sort_function = sort_generators.get(sort_function, linear_sort)
-    if isinstance(key_function, str):
-        key_function = key_functions[key_function]
-    result = src.copy()
+    src, grouping_function, sort_function, key_function = resolve_functions(src, grouping_function, sort_function, key_function)
     if coords:
+        result = src.copy()
         glitch = src.crop(coords)
     else:
-        glitch = result
+        # Every pixel is overwritten so there is no need to copy the source
+        result = glitch = blank_image(src)
     pixels = sort_pixels(
-                        list(glitch.getdata()),
+                        region_pixels(src, coords),
                         glitch.size,
                         grouping_function,
                         sort_function,
@@ -96,7 +337,7 @@ def sort_image(src, grouping_function, sort_function, key_function, reverse=Fals
                         **kwargs
                         )
 
-    glitch.putdata(pixels)
+    glitch.frombytes(pixels.tobytes())
     if coords:
         result.paste(glitch, coords)
     return result
@@ -107,7 +348,7 @@ def sort_part(src, coords, grouping_function, sort_function, key_function, rever
 
     :param src:        a Pillow Image object to be sorted OR a string indicating filepath to image.
     :param coords:     a tuple containing coordinates (left, upper, right, lower) to make PIL.Image.crop()
-    :param group_func: a shaping function or generator that OR a string that maps to a generator.
+    :param group_func: a shaping function or generator that OR a string that maps to a generator OR a GroupKind.
     :param sort_func:  a sorting function or generator OR a string that maps to a generator.
     :param key_func:   a function that is used as the key in python's sorted() function for pixels (tuples).
     :param reverse:    boolean used to reverse the sort order.
@@ -117,18 +358,11 @@ def sort_part(src, coords, grouping_function, sort_function, key_function, rever
     :returns:          a Pillow Image with the sorted pixels.
     """
 
-    if isinstance(src, str):
-        src = Image.open(src)
-    if isinstance(grouping_function, str):
-        grouping_function = group_generators[grouping_function]
-    if isinstance(sort_function, str):
-        sort_function = sort_generators.get(sort_function, linear_sort)
-    if isinstance(key_function, str):
-        key_function = key_functions[key_function]
+    src, grouping_function, sort_function, key_function = resolve_functions(src, grouping_function, sort_function, key_function)
     result = src.copy()
     glitch = src.crop(coords)
     pixels = sort_pixels(
-                        list(glitch.getdata()),
+                        region_pixels(src, coords),
                         glitch.size,
                         grouping_function,
                         sort_function,
@@ -138,7 +372,7 @@ def sort_part(src, coords, grouping_function, sort_function, key_function, rever
                         **kwargs
                         )
 
-    glitch.putdata(pixels)
+    glitch.frombytes(pixels.tobytes())
     result.paste(glitch, coords)
     return result
 
@@ -160,22 +394,24 @@ def sort_bands(src, group_tuple, sort_tuple, reverse=(False, False, False), pixe
     :returns:          a Pillow Image with sorted pixels.
     """
 
-    if isinstance(src, str):
-        src = Image.open(src)
-    sorted_bands = []
-    for index, band in enumerate(src.split()):
+    src = open_image(src)
+    if src.mode != "RGB":
+        src = src.convert("RGB")
+    width, height = src.size
+    # The bands are columns of one pixel array so the image doesn't have to be split into bands and merged again
+    pixel_array = np.array(src)
+    for index in range(3):
         pixels = sort_pixels(
-                        list(band.getdata()),
+                        pixel_array[..., index].reshape(width * height),
                         src.size,
                         group_tuple[index],
                         sort_tuple[index],
-                        lambda x: x,
+                        None,
                         reverse[index],
                         pixel_mods[index]
                         )
-        band.putdata(pixels)
-        sorted_bands.append(band)
-    glitch = Image.merge('RGB', tuple(sorted_bands))
+        pixel_array[..., index] = pixels.reshape(height, width)
+    glitch = Image.fromarray(pixel_array)
     return glitch
 
 def main():
@@ -2,6 +2,8 @@
 # Copyright (c) 2021 Mark Schloeman
 
 from colorsys import rgb_to_hsv
+import numpy as np
+
 def brightness_fast(pixel):
     """
     Perceived brightness estimation formula.
@@ -10,6 +12,34 @@ def brightness_fast(pixel):
     return ((pixel[0] + pixel[0] + pixel[1] + pixel[1] + pixel[1] + pixel[2]) / 6) / 255
 
 
+def brightness_fast_u16(pixels):
+    """
+    brightness_fast for a whole array of pixels at once as integers from 0 to 1530, that is brightness_fast * 1530.
+    Input should be an array with the channels on the last axis, like (n, 3) or (height, width, 3).
+    Returns a uint16 array with one less axis.
+    """
+    pixels = np.asarray(pixels)
+    # Each channel is a strided view so only the three channels used are read.
+    # 2 * 255 + 3 * 255 + 255 fits in a uint16
+    red, green, blue = (pixels[..., channel].astype(np.uint16) for channel in range(3))
+    return red * 2 + green * 3 + blue
+
+
+def brightness_fast_key(pixels):
+    """
+    A sort key for a whole array of pixels that puts them in the same order as brightness_fast.
+    brightness_fast is 2R + 3G + B divided by a constant, so the integer 2R + 3G + B sorts the same
+    and takes 2 bytes a pixel instead of 8.
+    Input should be an array with shape (n, channels).
+    Returns an int16 array of values from 0 to 1530.
+    """
+    pixels = np.asarray(pixels)
+    if pixels.dtype == np.uint8:
+        import kernels # Imported here so numba is only loaded when pixels are sorted
+        if kernels.compiled:
+            return kernels.brightness_keys(np.ascontiguousarray(pixels))
+    return brightness_fast_u16(pixels).astype(np.int16)
+
 def red(pixel):
     return pixel[0]
 
@@ -23,15 +53,43 @@ def blue(pixel):
 
 
 def hue(pixel):
-    return rgb_to_hsv(*pixel)[0]
+    return rgb_to_hsv(*pixel[:3])[0]
 
 
 def saturation(pixel):
-    return rgb_to_hsv(*pixel)[1]
+    return rgb_to_hsv(*pixel[:3])[1]
 
 
 def value(pixel):
-    return rgb_to_hsv(*pixel)[2]
+    return rgb_to_hsv(*pixel[:3])[2]
+
+
+# Versions of the hsv keys for a whole array of pixels at once, with shape (n, channels).
+# They do the same arithmetic as colorsys.rgb_to_hsv in the same order so the keys are exactly the same.
+def value_vec(pixels):
+    return np.max(pixels[:, :3], axis=1)
+
+
+def saturation_vec(pixels):
+    maxc = np.max(pixels[:, :3], axis=1).astype(np.float64)
+    rangec = maxc - np.min(pixels[:, :3], axis=1)
+    # Grey pixels (including black) have no saturation, dividing by 1 keeps numpy from warning about them
+    return np.where(rangec == 0, 0.0, rangec / np.where(maxc == 0, 1.0, maxc))
+
+
+def hue_vec(pixels):
+    r, g, b = (pixels[:, channel].astype(np.float64) for channel in range(3))
+    maxc = np.maximum(np.maximum(r, g), b)
+    rangec = maxc - np.minimum(np.minimum(r, g), b)
+    grey = rangec == 0
+    rangec[grey] = 1.0
+    rc = (maxc - r) / rangec
+    gc = (maxc - g) / rangec
+    bc = (maxc - b) / rangec
+    h = np.where(r == maxc, bc - gc, np.where(g == maxc, 2.0 + rc - bc, 4.0 + gc - rc))
+    h = (h / 6.0) % 1.0
+    h[grey] = 0.0
+    return h
 
 
 key_functions = {
@@ -39,3 +97,10 @@ key_functions = {
     "Red": red, "Green": green, "Blue": blue,
     "Hue": hue, "Saturation": saturation, "Value": value}
 
+# Versions of the key functions that take an array of pixels with shape (n, channels) and return an array of keys.
+# They put pixels in exactly the same order as the functions they replace so sort_pixels can use them instead of
+# calling the key function on every pixel. They give the same values too, except brightness which is kept as an integer.
+vector_key_functions = {
+    brightness_fast: brightness_fast_key,
+    red: lambda pixels: pixels[:, 0], green: lambda pixels: pixels[:, 1], blue: lambda pixels: pixels[:, 2],
+    hue: hue_vec, saturation: saturation_vec, value: value_vec}
@@ -1,27 +1,42 @@
 """ swizzle - take the channels from an image and rearrange them. """
 # Copyright (c) 2021 Mark Schloeman
 
+import numpy as np
 from PIL import Image
 
+from util import open_image
+
 def swizzle(source, swaps=None, coords=None):
     """Take an image and rearrange the channels.
 
     :param source: PIL image.
     :param swaps: a string with the letters "RGB" in any order.
+    :param coords: a tuple (left, upper, right, lower) like PIL.Image.crop() or None for the whole image.
     :returns: a PIL image.
     """
     channel_map = {"R": 0, "G": 1, "B": 2}
-    if isinstance(source, str):
-        source = Image.open(source)
-    glitch = source.copy()
+    swaps = swaps or "RGB"
+    if len(swaps) < 3:
+        raise ValueError(f"swaps needs a letter for each of the 3 channels, got {swaps!r}")
+    source = open_image(source)
+    if source.mode not in ("RGB", "RGBA"):
+        source = source.convert("RGB")
+    channel_order = [channel_map.get(c, 0) for c in swaps[:3]]
+    # The channels are rearranged in one numpy gather instead of splitting the image into bands and merging them.
+    # An alpha channel is left where it is.
+    pixels = np.array(source)
     if coords:
-        rgb = glitch.crop(coords).split()
+        # Only the part of coords inside the image changes, like cropping and pasting the region did
+        width, height = source.size
+        left, upper, right, lower = coords
+        left, right = min(max(left, 0), width), min(max(right, 0), width)
+        upper, lower = min(max(upper, 0), height), min(max(lower, 0), height)
+        region = pixels[upper : lower, left : right]
     else:
-        rgb = source.split()
-    bands = [rgb[channel_map.get(c, 0)] for c in swaps]
-    result = Image.merge("RGB", tuple(bands))
-    if coords:
-        glitch.paste(result, coords)
+        region = pixels
+    region[..., :3] = region[..., channel_order]
+    glitch = Image.fromarray(pixels)
+    glitch.info = source.info.copy()
     return glitch
 
 # Testing
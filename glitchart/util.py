@@ -6,6 +6,8 @@ import pathlib
 import random
 import configparser
 
+from PIL import Image
+
 
 def get_default_image_path():
     """ Returns a path to a default picture directory. 
@@ -24,6 +26,28 @@ def get_default_image_path():
             image_path = os.path.join(os.path.expanduser("~"), "pictures")
     return image_path
 
+def open_image(image):
+    """ Open image if it is a filepath, the glitch functions take either.
+
+    :param image: a PIL Image or a string with the path to an image.
+    :returns: a PIL Image.
+    """
+    if isinstance(image, str):
+        return Image.open(image)
+    return image
+
+def blank_image(image):
+    """ Make an image with the same mode, size, palette and info as image without copying its pixels.
+
+    :param image: a PIL Image.
+    :returns: a new PIL Image.
+    """
+    blank = Image.new(image.mode, image.size)
+    if image.palette:
+        blank.putpalette(image.getpalette(image.palette.mode), image.palette.mode)
+    blank.info = image.info.copy()
+    return blank
+
 # NOTE: I'm only using pathlib as a quick fix but I'd like to learn more about it and see if I could replace os
 # TODO: learn more about pathlib vs os
 def setup_image_path(base_dir):
@@ -53,12 +77,11 @@ def cli_prompt_image(directory=None):
     return os.path.join(directory, files[img_index])
 
 
-def make_temp_file(img, directory=None):
-    """ Saves a Pillow Image object with a temporary name in the given directory.
+def make_temp_filename(directory=None):
+    """ Makes a temporary filename in the given directory without creating the file.
     The image name will be of the form "temp" + [12 random characters A-G, 0-9].
-    NOTE: this currently only saves images to jpg files. I should update that to work with other filetypes.
+    NOTE: this currently only makes jpg filenames. I should update that to work with other filetypes.
 
-    :param img: PIL.Image object.
     :param directory: string for an absolute directory path. If left blank it will try to find a suitable default.
     :returns: a string for the absolute filepath of the temp image.
     """
@@ -68,7 +91,19 @@ def make_temp_file(img, directory=None):
     if directory is None:
         directory = os.path.join(get_default_image_path(), "temp")
     temp_name = "temp" + "".join(random.choice("ABCDEFG1234567890") for _ in range(12)) + ".jpg"
-    temp_file = os.path.join(directory, temp_name)
+    return os.path.join(directory, temp_name)
+
+
+def make_temp_file(img, directory=None):
+    """ Saves a Pillow Image object with a temporary name in the given directory.
+    See make_temp_filename for how the name is made.
+
+    :param img: PIL.Image object.
+    :param directory: string for an absolute directory path. If left blank it will try to find a suitable default.
+    :returns: a string for the absolute filepath of the temp image.
+    """
+
+    temp_file = make_temp_filename(directory)
     img.save(temp_file)
     img.filename = temp_file
     return temp_file